@@ -1,14 +1,27 @@
-import ee
-import numpy as np
-import matplotlib.pyplot as plt
+from __future__ import annotations
+
+import functools
 import os
+import threading
 import time
 import sys
+from datetime import datetime
+from typing import TYPE_CHECKING
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from utils import get_satellite_image_inputs, DEFAULT_OUTPUT_DIR
+from utils import get_satellite_image_inputs, get_ee, DEFAULT_OUTPUT_DIR
+from draft import DRAFT_DIR, FINAL, RenderProfile, get_profile
+from jobs import check_cancelled, report_progress
+from ee_limiter import ee_call, http_get
+from manifest import JobManifest, input_hash
+from tracing import set_trace_output, span, traced_job
+from transfer import (
+    LANDSAT_SCALE_M, check_format, filmstrip_frames_per_request, format_transfer, request_dimensions
+)
 
-ee.Initialize(project='solid-bliss-390413')
+if TYPE_CHECKING:
+    import ee
+    import numpy as np
 
 
 def get_landsat_config(year: int) -> dict:
@@ -51,6 +64,179 @@ def get_landsat_config(year: int) -> dict:
     raise ValueError(f"Unsupported year: {year}")
 
 
+IMAGE_DIMENSIONS = FINAL.image_dimensions
+PREVIEW_DIMENSIONS = 256
+PREVIEW_LOOKBACK_YEARS = 3
+# Years with no scenes are recorded independent of resolution, so a draft run spares the final one those queries.
+EMPTY_YEARS_JOB = "empty_years"
+STACK_JOB_SUFFIX = "_stack"
+# New scenes keep arriving for recent years, so an empty year is only trusted for this long.
+EMPTY_YEAR_TTL_SEC = 7 * 24 * 3600
+
+
+def year_input_hash(
+    year: int,
+    bbox: tuple[float, float, float, float],
+    dimensions: int = IMAGE_DIMENSIONS,
+    transfer_format: str = "png"
+) -> str:
+    # Lossless downloads keep their original hash so existing frames stay valid.
+    if transfer_format == "png":
+        return input_hash(get_landsat_config(year), bbox, dimensions)
+    return input_hash(get_landsat_config(year), bbox, dimensions, transfer_format)
+
+
+def landsat_dimensions(bbox: tuple[float, float, float, float], profile: RenderProfile = FINAL) -> int:
+    return request_dimensions(bbox, LANDSAT_SCALE_M, profile.image_dimensions)
+
+
+def scene_hash(year: int, bbox: tuple[float, float, float, float]) -> str:
+    return input_hash(get_landsat_config(year), bbox)
+
+
+def mark_empty(empty: JobManifest, year: int, bbox: tuple[float, float, float, float]) -> None:
+    if empty.claim(str(year), scene_hash(year, bbox)):
+        empty.complete(str(year))
+
+
+def year_collection(year: int, polygon: ee.Geometry) -> ee.ImageCollection:
+    ee = get_ee()
+    config = get_landsat_config(year)
+    return (
+        ee.ImageCollection(config["collection_id"])
+        .filterDate(f"{year}-01-01", f"{year}-12-31")
+        .filterBounds(polygon)
+        .filter(ee.Filter.lt("CLOUD_COVER", 10))
+    )
+
+
+def year_figure(img_np: np.ndarray, year: int):
+    from matplotlib.figure import Figure
+    
+    with span("annotate", year=year):
+        # Use a standalone Figure rather than pyplot so frames can be saved from worker threads.
+        fig = Figure(figsize=(8, 8))
+        ax = fig.add_subplot()
+        ax.imshow(img_np)
+        ax.axis('off')
+        ax.text(
+            img_np.shape[1] - 60,
+            img_np.shape[0] - 50,
+            str(year),
+            color='white',
+            fontsize=25,
+            fontweight='bold',
+            ha='right',
+            va='bottom',
+            bbox=dict(facecolor='black', alpha=0, pad=0)
+        )
+    return fig
+
+
+def temp_frame_path(save_path: str) -> str:
+    # Frames are written next to their final name and renamed, so a reader never sees a partial PNG.
+    return f"{save_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def save_year_frame(img_np: np.ndarray, year: int, output_dir: str, place_name: str) -> str:
+    from pyramid import build_pyramid
+    
+    fig = year_figure(img_np, year)
+    save_path = os.path.join(output_dir, f"{place_name}_{year}.png")
+    tmp_path = temp_frame_path(save_path)
+    with span("disk_write", year=year) as attrs:
+        fig.savefig(tmp_path, format="png", bbox_inches='tight', pad_inches=0, dpi=200)
+        os.replace(tmp_path, save_path)
+        attrs["bytes"] = os.path.getsize(save_path)
+    with span("pyramid", year=year):
+        build_pyramid(save_path)
+    return save_path
+
+
+def draft_annotate(img_np: np.ndarray, year: int) -> np.ndarray:
+    import cv2
+    
+    with span("annotate", year=year):
+        frame = cv2.cvtColor(img_np[..., :3], cv2.COLOR_RGB2BGR)
+        h, w = frame.shape[:2]
+        cv2.putText(frame, str(year), (w - 100, h - 15), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2, cv2.LINE_AA)
+    return frame
+
+
+def save_draft_frame(img_np: np.ndarray, year: int, output_dir: str, place_name: str) -> str:
+    import cv2
+    
+    frame = draft_annotate(img_np, year)
+    save_path = os.path.join(output_dir, f"{place_name}_{year}.png")
+    tmp_path = temp_frame_path(save_path)
+    with span("disk_write", year=year) as attrs:
+        with open(tmp_path, "wb") as f:
+            f.write(cv2.imencode(".png", frame)[1].tobytes())
+        os.replace(tmp_path, save_path)
+        attrs["bytes"] = os.path.getsize(save_path)
+    return save_path
+
+
+def stack_year_frame(img_np: np.ndarray, year: int, output_dir: str, place_name: str, profile: RenderProfile = FINAL) -> str:
+    import cv2
+    import numpy as np
+    from io import BytesIO
+    from frame_stack import append_frame, stack_path
+    
+    if profile == FINAL:
+        # Rendered exactly as the PNG would be, then kept as raw pixels in the stack.
+        buf = BytesIO()
+        year_figure(img_np, year).savefig(buf, format="png", bbox_inches='tight', pad_inches=0, dpi=200)
+        frame = cv2.imdecode(np.frombuffer(buf.getbuffer(), np.uint8), cv2.IMREAD_COLOR)
+    else:
+        frame = draft_annotate(img_np, year)
+    with span("disk_write", year=year) as attrs:
+        path = append_frame(stack_path(output_dir, place_name), year, frame, {"profile": profile.name})
+        attrs["bytes"] = frame.nbytes
+    return str(path)
+
+
+def frame_saver(profile: RenderProfile, container: bool = False):
+    if container:
+        return functools.partial(stack_year_frame, profile=profile)
+    # Drafts skip the matplotlib annotation and the pyramid build.
+    return save_year_frame if profile == FINAL else save_draft_frame
+
+
+@functools.lru_cache(maxsize=32)
+def preview_composite(
+    lat_top: float,
+    lat_bottom: float,
+    lon_left: float,
+    lon_right: float,
+    year: int | None = None,
+    dimensions: int = PREVIEW_DIMENSIONS
+) -> tuple[int, bytes] | None:
+    ee = get_ee()
+    polygon = ee.Geometry.Polygon([
+        [[lon_right, lat_top],
+         [lon_left, lat_top],
+         [lon_left, lat_bottom],
+         [lon_right, lat_bottom]]
+    ])
+    # The current year is usually incomplete, so start from the last full one.
+    latest = year or datetime.now().year - 1
+    for candidate in range(latest, latest - PREVIEW_LOOKBACK_YEARS, -1):
+        collection = year_collection(candidate, polygon)
+        if ee_call(collection.size().getInfo) == 0:
+            continue
+        config = get_landsat_config(candidate)
+        image = collection.median().visualize(
+            bands=[config["band_red"], config["band_green"], config["band_blue"]],
+            min=config["vmin"],
+            max=config["vmax"],
+        )
+        url = ee_call(image.getThumbURL, {'region': polygon, 'dimensions': dimensions, 'format': 'png'})
+        return candidate, http_get(url).content
+    return None
+
+
+@traced_job("satellite_images")
 def download_satellite_images(
     place_name: str,
     start_year: int,
@@ -58,8 +244,17 @@ def download_satellite_images(
     lat_top: float,
     lat_bottom: float,
     lon_left: float,
-    lon_right: float
+    lon_right: float,
+    single_request: bool = False,
+    draft: bool = False,
+    statistics: list[str] | None = None,
+    stats_format: str = "csv",
+    transfer_format: str | None = None,
+    container: bool = False
 ) -> None:
+    ee = get_ee()
+    profile = get_profile(draft)
+    transfer_format = check_format(transfer_format or profile.transfer_format)
     polygon = ee.Geometry.Polygon([
         [[lon_right, lat_top],
          [lon_left, lat_top],
@@ -68,76 +263,260 @@ def download_satellite_images(
     ])
     
     output_dir = os.path.join(DEFAULT_OUTPUT_DIR, place_name)
-    os.makedirs(output_dir, exist_ok=True)
+    frame_dir = os.path.join(output_dir, DRAFT_DIR) if draft else output_dir
+    os.makedirs(frame_dir, exist_ok=True)
+    set_trace_output(output_dir)
+    # PNGs and the frame stack are separate outputs, so each format tracks its own finished years.
+    manifest = JobManifest(output_dir, f"satellite_images{profile.suffix}{STACK_JOB_SUFFIX if container else ''}")
+    empty = JobManifest(output_dir, EMPTY_YEARS_JOB, max_age=EMPTY_YEAR_TTL_SEC)
+    save_frame = frame_saver(profile, container)
+    bbox = (lat_top, lat_bottom, lon_left, lon_right)
+    dimensions = landsat_dimensions(bbox, profile)
+    print(f"Requesting {dimensions}px {transfer_format.upper()} frames")
+    
+    if statistics:
+        try:
+            export_statistics(place_name, start_year, stop_year, polygon, output_dir, statistics, stats_format)
+        except Exception as e:
+            print(f"Statistics failed: {e}")
     
+    if single_request:
+        try:
+            download_filmstrip(
+                place_name, start_year, stop_year, polygon, frame_dir, manifest, bbox, profile, empty,
+                dimensions, transfer_format, container
+            )
+            return
+        except Exception as e:
+            print(f"Filmstrip request failed, falling back to one request per year: {e}")
+    
+    total = stop_year - start_year + 1
+    transferred = []
     for year in range(start_year, stop_year + 1):
+        check_cancelled()
+        report_progress(year - start_year, total, str(year))
+        unit = str(year)
+        if empty.is_done(unit, scene_hash(year, bbox)):
+            print(f"[{year}] No images found in an earlier run, skipping.")
+            continue
+        unit_hash = year_input_hash(year, bbox, dimensions, transfer_format)
+        if not manifest.claim(unit, unit_hash):
+            if manifest.is_done(unit, unit_hash):
+                print(f"[{year}] Already downloaded, skipping.")
+            else:
+                print(f"[{year}] Being downloaded by another worker, skipping.")
+            continue
         try:
             start_time = time.time()
             config = get_landsat_config(year)
+            collection = year_collection(year, polygon)
             
-            collection = (
-                ee.ImageCollection(config["collection_id"])
-                .filterDate(f"{year}-01-01", f"{year}-12-31")
-                .filterBounds(polygon)
-                .filter(ee.Filter.lt("CLOUD_COVER", 10))
-            )
-            
-            collection_size = collection.size().getInfo()
+            with span("server_compute", year=year, call="size"):
+                collection_size = ee_call(collection.size().getInfo)
             if collection_size == 0:
                 print(f"[{year}] No images found, skipping.")
+                manifest.skip(unit, "no images")
+                mark_empty(empty, year, bbox)
                 continue
             
             image = collection.median().select([config["band_red"], config["band_green"], config["band_blue"]])
             
-            region = polygon.bounds().getInfo()['coordinates']
-            url = image.getThumbURL({
-                'region': region,
-                'dimensions': 2500,
-                'bands': [config["band_red"], config["band_green"], config["band_blue"]],
-                'format': 'png',
-                'min': config["vmin"],
-                'max': config["vmax"],
-            })
+            with span("server_compute", year=year, call="bounds"):
+                region = ee_call(polygon.bounds().getInfo)['coordinates']
+            with span("thumb_url", year=year):
+                url = ee_call(image.getThumbURL, {
+                    'region': region,
+                    'dimensions': dimensions,
+                    'bands': [config["band_red"], config["band_green"], config["band_blue"]],
+                    'format': transfer_format,
+                    'min': config["vmin"],
+                    'max': config["vmax"],
+                })
             
-            import requests
+            import numpy as np
             from io import BytesIO
             from PIL import Image
             
-            response = requests.get(url)
-            img = Image.open(BytesIO(response.content))
-            img_np = np.array(img)
-            
-            plt.figure(figsize=(8, 8))
-            plt.imshow(img_np)
-            plt.axis('off')
-            plt.text(
-                img_np.shape[1] - 60,
-                img_np.shape[0] - 50,
-                str(year),
-                color='white',
-                fontsize=25,
-                fontweight='bold',
-                ha='right',
-                va='bottom',
-                bbox=dict(facecolor='black', alpha=0, pad=0)
-            )
+            with span("http_download", year=year) as attrs:
+                response = http_get(url)
+                attrs["bytes"] = len(response.content)
+                attrs["format"] = transfer_format
+            transferred.append(len(response.content))
+            with span("decode", year=year) as attrs:
+                img = Image.open(BytesIO(response.content))
+                img_np = np.array(img)
+                attrs["pixels"] = img_np.shape[0] * img_np.shape[1]
             
-            save_path = os.path.join(output_dir, f"{place_name}_{year}.png")
-            plt.savefig(save_path, bbox_inches='tight', pad_inches=0, dpi=200)
-            plt.close()
+            save_path = save_frame(img_np, year, frame_dir, place_name)
+            manifest.complete(unit, save_path)
             
             end_time = time.time()
-            print(f"[{year}] Saved: {save_path}, Runtime: {end_time - start_time:.2f} sec")
+            print(f"[{year}] Saved: {save_path}, {len(response.content) / 1e3:.0f} KB, Runtime: {end_time - start_time:.2f} sec")
             
         except Exception as e:
+            manifest.fail(unit, str(e))
             print(f"[{year}] Error: {e}")
             continue
+    
+    if transferred:
+        print(f"Transferred {format_transfer(sum(transferred), len(transferred), transfer_format)}")
+
+
+def export_statistics(
+    place_name: str,
+    start_year: int,
+    stop_year: int,
+    polygon: ee.Geometry,
+    output_dir: str,
+    statistics: list[str],
+    stats_format: str = "csv"
+) -> str:
+    from year_stats import statistics_format, statistics_path, write_statistics, year_statistics
+    
+    stats_format = statistics_format(stats_format)
+    start_time = time.time()
+    rows = year_statistics(list(range(start_year, stop_year + 1)), polygon, statistics)
+    path = write_statistics(rows, statistics_path(output_dir, place_name, stats_format))
+    print(f"Saved statistics for {len(rows)} years: {path}, Runtime: {time.time() - start_time:.2f} sec")
+    return path
+
+
+def download_filmstrip(
+    place_name: str,
+    start_year: int,
+    stop_year: int,
+    polygon: ee.Geometry,
+    output_dir: str,
+    manifest: JobManifest,
+    bbox: tuple[float, float, float, float],
+    profile: RenderProfile = FINAL,
+    empty: JobManifest | None = None,
+    dimensions: int | None = None,
+    transfer_format: str = "png",
+    container: bool = False
+) -> None:
+    start_time = time.time()
+    dimensions = dimensions or profile.image_dimensions
+    years = [
+        year for year in range(start_year, stop_year + 1)
+        if not (empty and empty.is_done(str(year), scene_hash(year, bbox)))
+        and manifest.claim(str(year), year_input_hash(year, bbox, dimensions, transfer_format))
+    ]
+    if not years:
+        print("All years already downloaded.")
+        return
+    
+    try:
+        fetch_filmstrip(
+            place_name, years, polygon, output_dir, manifest, profile, bbox, empty, dimensions, transfer_format, container
+        )
+    except BaseException as e:
+        for year in years:
+            if not manifest.is_done(str(year), year_input_hash(year, bbox, dimensions, transfer_format)):
+                manifest.fail(str(year), str(e))
+        raise
+    print(f"Filmstrip runtime: {time.time() - start_time:.2f} sec")
+
+
+def fetch_filmstrip(
+    place_name: str,
+    years: list[int],
+    polygon: ee.Geometry,
+    output_dir: str,
+    manifest: JobManifest,
+    profile: RenderProfile = FINAL,
+    bbox: tuple[float, float, float, float] | None = None,
+    empty: JobManifest | None = None,
+    dimensions: int | None = None,
+    transfer_format: str = "png",
+    container: bool = False
+) -> None:
+    ee = get_ee()
+    save_frame = frame_saver(profile, container)
+    start_time = time.time()
+    collections = [year_collection(year, polygon) for year in years]
+    
+    with span("server_compute", call="sizes"):
+        info = ee_call(ee.Dictionary({
+            'sizes': ee.List([c.size() for c in collections]),
+            'region': polygon.bounds().coordinates(),
+        }).getInfo)
+    
+    frames = []
+    valid_years = []
+    for year, collection, size in zip(years, collections, info['sizes']):
+        if size == 0:
+            print(f"[{year}] No images found, skipping.")
+            manifest.skip(str(year), "no images")
+            if empty and bbox:
+                mark_empty(empty, year, bbox)
+            continue
+        config = get_landsat_config(year)
+        # Stretch each sensor to 8-bit on the server so all years share one request.
+        frames.append(collection.median().visualize(
+            bands=[config["band_red"], config["band_green"], config["band_blue"]],
+            min=config["vmin"],
+            max=config["vmax"],
+        ))
+        valid_years.append(year)
+    
+    if not frames:
+        print("No images found for any year.")
+        return
+    
+    import numpy as np
+    from io import BytesIO
+    from PIL import Image
+    
+    dimensions = dimensions or profile.image_dimensions
+    per_request = filmstrip_frames_per_request(dimensions)
+    transferred = 0
+    for first in range(0, len(frames), per_request):
+        chunk_years = valid_years[first:first + per_request]
+        with span("thumb_url", frames=len(chunk_years)):
+            url = ee_call(ee.ImageCollection(frames[first:first + per_request]).getFilmstripThumbURL, {
+                'region': info['region'],
+                'dimensions': dimensions,
+                'format': transfer_format,
+            })
+        with span("http_download", frames=len(chunk_years)) as attrs:
+            response = http_get(url)
+            attrs["bytes"] = len(response.content)
+            attrs["format"] = transfer_format
+        with span("decode", frames=len(chunk_years)) as attrs:
+            strip = np.array(Image.open(BytesIO(response.content)))
+            attrs["pixels"] = strip.shape[0] * strip.shape[1]
+        transferred += len(response.content)
+        print(f"Fetched filmstrip of {len(chunk_years)} frames in {time.time() - start_time:.2f} sec")
+        
+        # Filmstrip frames are stacked vertically, all the same height.
+        frame_h = strip.shape[0] // len(chunk_years)
+        for i, year in enumerate(chunk_years):
+            check_cancelled()
+            report_progress(first + i, len(valid_years), str(year))
+            try:
+                img_np = strip[i * frame_h:(i + 1) * frame_h]
+                save_path = save_frame(img_np, year, output_dir, place_name)
+                manifest.complete(str(year), save_path)
+                print(f"[{year}] Saved: {save_path}")
+            except Exception as e:
+                manifest.fail(str(year), str(e))
+                print(f"[{year}] Error: {e}")
+    print(f"Transferred {format_transfer(transferred, len(valid_years), transfer_format)}")
 
 
 if __name__ == "__main__":
     try:
+        from year_stats import DEFAULT_STATISTICS
         place_name, start_year, stop_year, lat_top, lat_bottom, lon_left, lon_right = get_satellite_image_inputs()
-        download_satellite_images(place_name, start_year, stop_year, lat_top, lat_bottom, lon_left, lon_right)
+        download_satellite_images(
+            place_name, start_year, stop_year, lat_top, lat_bottom, lon_left, lon_right,
+            single_request="--single-request" in sys.argv,
+            draft="--draft" in sys.argv,
+            transfer_format="jpg" if "--jpg" in sys.argv else None,
+            container="--container" in sys.argv,
+            statistics=DEFAULT_STATISTICS if "--stats" in sys.argv else None,
+        )
     except Exception as e:
         print(f"An error occurred: {e}")
         input("Press Enter to exit...")
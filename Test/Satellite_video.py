@@ -1,14 +1,21 @@
-import cv2
+from __future__ import annotations
+
+import math
 import re
-import numpy as np
 from pathlib import Path
-from PIL import Image, ImageDraw, ImageFont
-from matplotlib import font_manager
+from typing import TYPE_CHECKING
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from utils import get_video_inputs, DEFAULT_OUTPUT_DIR
+from draft import DRAFT_DIR, get_profile
+from fonts import load_font
+from segment_encoder import SEGMENT_SEC, encode_timeline
+from tracing import set_trace_output, span, traced_job
+
+if TYPE_CHECKING:
+    import numpy as np
 
 
 FPS = 30
@@ -18,33 +25,91 @@ HOLD_SEC = 2
 FAST_IMG_SEC = 0.35
 SLOW_IMG_SEC = 1.0
 OUT_W, OUT_H = 1920, 1080
+FRAME_EXTS = {".png", ".jpg", ".jpeg", ".bmp", ".tif"}
+PLAIN_CACHE = 8
+COMPARISON_MODES = ("split", "wipe", "diff")
+# A comparison replaces the four before/after hold blocks, so the video keeps its length.
+COMPARE_SEC = 4 * HOLD_SEC
+DIVIDER_PX = 4
+DIFF_GAIN = 3.0
+DIFF_ALPHA = 0.6
+
+
+def frames(sec: float, fps: int = FPS) -> int:
+    return int(round(fps * sec))
+
+
+def comparison_runs(mode: str, before: int, after: int, fps: int = FPS) -> list[tuple[tuple, int]]:
+    total = frames(COMPARE_SEC, fps)
+    if mode == "wipe":
+        # One key per frame: the divider sweeps across and back.
+        return [(("wipe", before, after, t, total), 1) for t in range(total)]
+    if mode in ("split", "diff"):
+        return [((mode, before, after), total)]
+    raise ValueError(f"Unknown comparison mode: {mode}")
+
+
+def video_timeline(
+    n_images: int,
+    fps: int = FPS,
+    comparison: str | None = None,
+    pair: tuple[int, int] | None = None
+) -> list[tuple[tuple, int]]:
+    last = n_images - 1
+    hold = frames(HOLD_SEC, fps)
+    runs = [(("title", 0), frames(TITLE_SEC, fps))]
+    runs += [(("fast", i), hold if i == 0 else frames(FAST_IMG_SEC, fps)) for i in range(n_images)]
+    if comparison:
+        runs += comparison_runs(comparison, *(pair or (0, last)), fps)
+    else:
+        runs += [(("plain", last), hold), (("plain", 0), hold)] * 2
+    runs += [(("slow", i), frames(SLOW_IMG_SEC, fps)) for i in range(n_images)]
+    runs += [(("slow", last), hold), (("thanks", last), frames(END_PAUSE_SEC, fps))]
+    return runs
+
 
+def video_frame_count(n_images: int, fps: int = FPS, comparison: str | None = None) -> int:
+    return sum(count for _, count in video_timeline(n_images, fps, comparison))
 
-def frames(sec: float) -> int:
-    return int(round(FPS * sec))
 
+def year_frames(folder: Path, place_name: str) -> list[Path]:
+    pattern = re.compile(rf"{re.escape(place_name)}_(\d{{4}})")
+    found = []
+    for p in folder.iterdir():
+        m = pattern.fullmatch(p.stem)
+        if m and p.suffix.lower() in FRAME_EXTS:
+            found.append((int(m.group(1)), p))
+    return [p for _, p in sorted(found)]
 
-def numeric_key(path: Path) -> int:
-    m = re.search(r"\d+", path.stem)
-    return int(m.group()) if m else 0
+
+def year_sources(folder: Path, place_name: str) -> list[Path | tuple[str, int]]:
+    from frame_stack import merge_sources, stack_sources
+    
+    # A packed frame stack takes precedence over loose yearly images of the same year.
+    return merge_sources(stack_sources(folder, place_name), year_frames(folder, place_name))
 
 
 def make_title_frame(bg_img: np.ndarray, title: str, start_year: int, stop_year: int) -> np.ndarray:
+    import cv2
+    import numpy as np
+    from PIL import Image, ImageDraw
+    
     lines = [title, "Time Lapse", f"{start_year} – {stop_year}"]
-    font_path = font_manager.findfont("DejaVu Sans")
     
+    h, w = bg_img.shape[:2]
+    scale = h / OUT_H
     pil = Image.fromarray(cv2.cvtColor(bg_img, cv2.COLOR_BGR2RGB))
     draw = ImageDraw.Draw(pil)
-    pil_font = ImageFont.truetype(font_path, 120)
-    line_spacing = 35
+    pil_font = load_font("DejaVu Sans", "DejaVuSans.ttf", round(120 * scale))
+    line_spacing = round(35 * scale)
     
     text_heights = [draw.textbbox((0, 0), line, font=pil_font)[3] for line in lines]
     total_h = sum(text_heights) + line_spacing * (len(lines) - 1)
-    y = (OUT_H - total_h) // 2
+    y = (h - total_h) // 2
     
     for txt, t_h in zip(lines, text_heights):
         bbox = draw.textbbox((0, 0), txt, font=pil_font)
-        x = (OUT_W - bbox[2]) // 2
+        x = (w - bbox[2]) // 2
         draw.text((x, y), txt, font=pil_font, fill=(255, 255, 255))
         y += t_h + line_spacing
     
@@ -52,123 +117,223 @@ def make_title_frame(bg_img: np.ndarray, title: str, start_year: int, stop_year:
 
 
 def make_thanks_frame(last_frame: np.ndarray) -> np.ndarray:
-    font_path = font_manager.findfont("DejaVu Sans")
+    import cv2
+    import numpy as np
+    from PIL import Image, ImageDraw
+    
     thanks_text = "Thanks for watching"
-    thanks_font = ImageFont.truetype(font_path, 125)
+    h, w = last_frame.shape[:2]
+    scale = h / OUT_H
+    thanks_font = load_font("DejaVu Sans", "DejaVuSans.ttf", round(125 * scale))
     
     thanks_pil = Image.fromarray(cv2.cvtColor(last_frame, cv2.COLOR_BGR2RGB))
     draw = ImageDraw.Draw(thanks_pil)
     bbox = draw.textbbox((0, 0), thanks_text, font=thanks_font)
-    x_thanks = (OUT_W - bbox[2]) // 2
-    y_thanks = OUT_H - 500
+    x_thanks = (w - bbox[2]) // 2
+    y_thanks = h - round(500 * scale)
     draw.text((x_thanks, y_thanks - bbox[3]), thanks_text, font=thanks_font, fill=(255, 255, 255))
     return cv2.cvtColor(np.array(thanks_pil), cv2.COLOR_RGB2BGR)
 
 
-def create_video(place_name: str, title: str, start_year: int, stop_year: int) -> None:
+def load_plain(path: str | tuple[str, int], context: dict, cache: dict) -> np.ndarray | None:
+    import cv2
+    from frame_stack import load_source, source_name
+    
+    plain = cache.setdefault("plain", {})
+    if path not in plain:
+        w, h = context["size"]
+        interpolation = cv2.INTER_NEAREST if context["fast_resample"] else cv2.INTER_LINEAR
+        with span("decode", file=source_name(path)):
+            frame = load_source(path, (w, h))
+            if frame is not None and frame.shape[:2] != (h, w):
+                frame = cv2.resize(frame, (w, h), interpolation=interpolation)
+        if frame is not None and context.get("luts"):
+            from normalize import apply_lut
+            with span("normalize", file=source_name(path)):
+                frame = apply_lut(frame, context["luts"][path])
+        if len(plain) >= PLAIN_CACHE:
+            # Frames the comparison reuses are never evicted, so they are decoded only once.
+            pinned = context.get("pinned", ())
+            plain.pop(next((p for p in plain if p not in pinned), next(iter(plain))))
+        plain[path] = frame
+    return plain[path]
+
+
+def label_frame(frame: np.ndarray, text: str) -> np.ndarray:
+    import cv2
+    
+    h = frame.shape[0]
+    scale = h / OUT_H
+    labelled = frame.copy()
+    pos = (round(20 * scale), h - round(40 * scale))
+    cv2.putText(labelled, text, pos, cv2.FONT_HERSHEY_SIMPLEX, 2 * scale, (255, 255, 255), max(1, round(3 * scale)), cv2.LINE_AA)
+    return labelled
+
+
+def put_label(out: np.ndarray, text: str, x: int, align_right: bool = False) -> None:
+    import cv2
+    
+    h = out.shape[0]
+    scale = h / OUT_H
+    font_scale, thickness = 2 * scale, max(1, round(3 * scale))
+    if align_right:
+        x -= cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)[0][0]
+    cv2.putText(out, text, (x, h - round(40 * scale)), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), thickness, cv2.LINE_AA)
+
+
+def compare_buffers(shape: tuple[int, ...], cache: dict) -> dict:
+    import numpy as np
+    
+    buffers = cache.get("compare")
+    if buffers is None or buffers["out"].shape != shape:
+        buffers = cache["compare"] = {
+            "out": np.empty(shape, np.uint8),
+            "diff": np.empty(shape, np.uint8),
+            "gray": np.empty(shape[:2], np.uint8),
+        }
+    return buffers
+
+
+def render_comparison(key: tuple, context: dict, cache: dict) -> np.ndarray | None:
+    import cv2
+    
+    kind, before_i, after_i = key[:3]
+    before = load_plain(context["files"][before_i], context, cache)
+    after = load_plain(context["files"][after_i], context, cache)
+    if before is None or after is None:
+        return None
+    buffers = compare_buffers(after.shape, cache)
+    # The writer consumes each frame before the next is rendered, so one buffer is reused throughout.
+    out = buffers["out"]
+    h, w = out.shape[:2]
+    margin = round(20 * h / OUT_H)
+    before_year, after_year = str(context["years"][before_i]), str(context["years"][after_i])
+    
+    with span("overlay", kind=kind):
+        if kind == "split":
+            # Centre halves of both years side by side.
+            half = w // 2
+            left = (w - half) // 2
+            out[:, :half] = before[:, left:left + half]
+            out[:, half:] = after[:, left:left + w - half]
+            out[:, half - DIVIDER_PX // 2:half + DIVIDER_PX // 2] = 255
+            put_label(out, before_year, margin)
+            put_label(out, after_year, w - margin, align_right=True)
+        elif kind == "wipe":
+            t, total = key[3:]
+            x = round(w * (1 - math.cos(2 * math.pi * t / total)) / 2)
+            out[:, :x] = after[:, :x]
+            out[:, x:] = before[:, x:]
+            out[:, max(0, x - DIVIDER_PX // 2):x + DIVIDER_PX // 2] = 255
+            put_label(out, after_year, margin)
+            put_label(out, before_year, w - margin, align_right=True)
+        else:
+            diff, gray = buffers["diff"], buffers["gray"]
+            cv2.absdiff(before, after, dst=diff)
+            cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY, dst=gray)
+            cv2.convertScaleAbs(gray, dst=gray, alpha=DIFF_GAIN)
+            cv2.applyColorMap(gray, cv2.COLORMAP_JET, dst=diff)
+            cv2.addWeighted(after, 1 - DIFF_ALPHA, diff, DIFF_ALPHA, 0, dst=out)
+            put_label(out, f"{before_year} - {after_year}", margin)
+    return out
+
+
+def render_frame(key: tuple, context: dict, cache: dict) -> np.ndarray | None:
+    kind, index = key[:2]
+    if kind in COMPARISON_MODES:
+        return render_comparison(key, context, cache)
+    plain = load_plain(context["files"][index], context, cache)
+    if plain is None or kind == "plain":
+        return plain
+    with span("overlay", kind=kind):
+        if kind == "title":
+            return make_title_frame(plain.copy(), context["title"], context["start_year"], context["stop_year"])
+        if kind == "thanks":
+            return make_thanks_frame(label_frame(plain, "slow"))
+        return label_frame(plain, kind)
+
+
+@traced_job("create_video")
+def create_video(
+    place_name: str,
+    title: str,
+    start_year: int,
+    stop_year: int,
+    workers: int | None = None,
+    segment_sec: float = SEGMENT_SEC,
+    draft: bool = False,
+    comparison: str | None = None,
+    compare_years: tuple[int, int] | None = None,
+    normalize: str | None = None,
+    year_range: tuple[int, int] | None = None
+) -> None:
+    from frame_stack import source_size, source_year
+    
+    profile = get_profile(draft)
     folder = Path(DEFAULT_OUTPUT_DIR, place_name)
-    outfile = folder / f"{place_name}_TimeLapse.mp4"
-    exts = {".png", ".jpg", ".jpeg", ".bmp", ".tif"}
+    set_trace_output(str(folder))
+    outfile = folder / f"{place_name}_TimeLapse{profile.suffix}.mp4"
     
     try:
-        files = sorted([p for p in folder.iterdir() if p.suffix.lower() in exts], key=numeric_key)
+        found = year_sources(folder, place_name)
+        # Drafts use draft downloads, or the small pyramid levels of final frames when there are none.
+        if draft and (folder / DRAFT_DIR).is_dir():
+            found = year_sources(folder / DRAFT_DIR, place_name) or found
+        files = [p if isinstance(p, tuple) else str(p) for p in found if source_size(p) is not None]
+        if year_range:
+            # A folder shared by several jobs can hold more years than this video should show.
+            files = [f for f in files if year_range[0] <= source_year(f) <= year_range[1]]
         if not files:
             raise FileNotFoundError("No images found in the folder.")
     except FileNotFoundError as e:
         print(f"Error: {e}")
         return
     
-    first_raw = cv2.imread(str(files[0]))
-    if first_raw is None:
-        print("Error: Could not read first image.")
-        return
+    years = [source_year(f) for f in files]
+    pair = None
+    if comparison:
+        first, last = compare_years or (years[0], years[-1])
+        if first not in years or last not in years:
+            print(f"Error: No images for comparison years {first} and {last}.")
+            return
+        pair = (years.index(first), years.index(last))
     
-    first = cv2.resize(first_raw, (OUT_W, OUT_H), cv2.INTER_AREA)
-    
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    writer = cv2.VideoWriter(str(outfile), fourcc, FPS, (OUT_W, OUT_H))
-    
-    title_frame = make_title_frame(first.copy(), title, start_year, stop_year)
-    for _ in range(frames(TITLE_SEC)):
-        writer.write(title_frame)
-    
-    label_pos = (20, OUT_H - 40)
-    font_face = cv2.FONT_HERSHEY_SIMPLEX
-    font_scale = 2
-    thick = 3
-    fast_repeat = frames(FAST_IMG_SEC)
-    slow_repeat = frames(SLOW_IMG_SEC)
-    frames_hold = frames(HOLD_SEC)
-    
-    last_plain_fast = None
-    for idx, img_path in enumerate(files):
-        frame_plain = cv2.imread(str(img_path))
-        if frame_plain is None:
-            continue
-        if frame_plain.shape[:2] != (OUT_H, OUT_W):
-            frame_plain = cv2.resize(frame_plain, (OUT_W, OUT_H), cv2.INTER_AREA)
-        
-        frame_fast = frame_plain.copy()
-        cv2.putText(frame_fast, "fast", label_pos, font_face, font_scale, (255, 255, 255), thick, cv2.LINE_AA)
-        
-        repeat = frames_hold if idx == 0 else fast_repeat
-        for _ in range(repeat):
-            writer.write(frame_fast)
-        
-        last_plain_fast = frame_plain.copy()
-    
-    first_plain_slow = cv2.imread(str(files[0]))
-    if first_plain_slow is None:
-        writer.release()
-        print("Error: Could not read first slow frame.")
-        return
-    if first_plain_slow.shape[:2] != (OUT_H, OUT_W):
-        first_plain_slow = cv2.resize(first_plain_slow, (OUT_W, OUT_H), cv2.INTER_AREA)
-    
-    for _ in range(frames_hold):
-        writer.write(last_plain_fast)
-    for _ in range(frames_hold):
-        writer.write(first_plain_slow)
-    for _ in range(frames_hold):
-        writer.write(last_plain_fast)
-    for _ in range(frames_hold):
-        writer.write(first_plain_slow)
-    
-    last_frame = None
-    for img_path in files:
-        frame_plain = cv2.imread(str(img_path))
-        if frame_plain is None:
-            continue
-        if frame_plain.shape[:2] != (OUT_H, OUT_W):
-            frame_plain = cv2.resize(frame_plain, (OUT_W, OUT_H), cv2.INTER_AREA)
-        
-        frame_slow = frame_plain.copy()
-        cv2.putText(frame_slow, "slow", label_pos, font_face, font_scale, (255, 255, 255), thick, cv2.LINE_AA)
-        
-        for _ in range(slow_repeat):
-            writer.write(frame_slow)
-        last_frame = frame_slow.copy()
-    
-    if last_frame is None:
-        writer.release()
+    context = {
+        "files": files,
+        "years": years,
+        "pinned": {files[i] for i in pair} if pair else (),
+        "title": title,
+        "start_year": start_year,
+        "stop_year": stop_year,
+        "size": profile.video_size,
+        "fast_resample": profile.fast_resample,
+    }
+    if normalize:
+        from normalize import fit_frames
+        # Tone curves are fitted once on small previews and applied to each frame as it is decoded.
+        context["luts"] = fit_frames(files, normalize)
+    runs = video_timeline(len(files), profile.video_fps, comparison, pair)
+    written = encode_timeline(
+        str(outfile), runs, render_frame, context, profile.video_fps, profile.video_size, workers, segment_sec
+    )
+    if written == 0:
         print("Error: No valid frames processed.")
         return
     
-    for _ in range(frames_hold):
-        writer.write(last_frame)
-    
-    thanks_frame = make_thanks_frame(last_frame)
-    for _ in range(frames(END_PAUSE_SEC)):
-        writer.write(thanks_frame)
-    
-    writer.release()
+    with span("video_file", frames=written) as attrs:
+        attrs["bytes"] = outfile.stat().st_size
     print(f"Done! Slideshow saved: {outfile}")
 
 
 if __name__ == "__main__":
     try:
         place_name, title, start_year, stop_year = get_video_inputs()
-        create_video(place_name, title, start_year, stop_year)
+        comparison = next((m for m in COMPARISON_MODES if f"--{m}" in sys.argv), None)
+        normalize = "histogram" if "--histogram" in sys.argv else "gain" if "--normalize" in sys.argv else None
+        create_video(
+            place_name, title, start_year, stop_year,
+            draft="--draft" in sys.argv, comparison=comparison, normalize=normalize
+        )
     except Exception as e:
         print(f"An error occurred: {e}")
         input("Press Enter to exit...")
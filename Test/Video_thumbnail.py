@@ -1,91 +1,175 @@
-import cv2
-import re
-import numpy as np
+from __future__ import annotations
+
+from functools import lru_cache
 from pathlib import Path
-from PIL import Image, ImageDraw, ImageFont
-from matplotlib import font_manager
+from typing import TYPE_CHECKING
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from utils import get_thumbnail_inputs, DEFAULT_OUTPUT_DIR
+from fonts import load_font
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+
+THUMBNAIL_PROFILES = {
+    "youtube": (1280, 720),
+    "square": (1080, 1080),
+}
+
+# Stroke widths in pixels of the source frame, outermost first.
+CAPTION_STROKES = [
+    (10, (0, 0, 0, 255)),
+    (4, (255, 55, 0, 255)),
+    (2, (255, 255, 0, 255)),
+]
+CAPTION_FILL = (255, 255, 255, 255)
+
+
+@lru_cache(maxsize=64)
+def caption_layer(caption: str, size: tuple[int, int], scale: float = 0.5) -> Image.Image:
+    from PIL import Image, ImageDraw
+    
+    # Laid out in source-frame coordinates, as a caption on the full frame would be, then drawn
+    # directly at the target size with the font and strokes scaled to match.
+    width, height = size
+    src_font = load_font("Arial", "arial.ttf", max(1, int(height / scale / 5)))
+    font = load_font("Arial", "arial.ttf", max(1, round(src_font.size * scale)))
+    layer = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+
+    lines = caption.split("\n")
+    line_spacing = int(src_font.size * 1.2)
+    line_sizes = [draw.textbbox((0, 0), line, font=src_font) for line in lines]
+    line_widths = [bbox[2] - bbox[0] for bbox in line_sizes]
+    line_heights = [bbox[3] - bbox[1] for bbox in line_sizes]
+    text_block_height = sum(line_heights) + line_spacing * (len(lines) - 1)
+
+    current_y = (round(height / scale) - text_block_height) // 2
+    for line, line_width, line_height in zip(lines, line_widths, line_heights):
+        x_line = (round(width / scale) - line_width) // 2
+        # Glyph advances round to whole pixels at the smaller size, so each glyph is placed where the
+        # source font puts it; otherwise a long line drifts by several pixels.
+        glyphs = [
+            ((x_line + src_font.getlength(line[:i])) * scale, current_y * scale, char)
+            for i, char in enumerate(line) if not char.isspace()
+        ]
+        for width_px, color in CAPTION_STROKES:
+            stroke = max(1, round(width_px * scale))
+            for x, y, char in glyphs:
+                draw.text((x, y), char, font=font, fill=(255, 255, 255, 0), stroke_width=stroke, stroke_fill=color)
+        for x, y, char in glyphs:
+            draw.text((x, y), char, font=font, fill=CAPTION_FILL)
+        current_y += line_height + line_spacing
+
+    return layer
+
+
+def fit_to_size(image: Image.Image, size: tuple[int, int]) -> Image.Image:
+    from PIL import Image
+    
+    width, height = size
+    src_w, src_h = image.size
+    scale = max(width / src_w, height / src_h)
+    crop_w, crop_h = width / scale, height / scale
+    left = (src_w - crop_w) / 2
+    top = (src_h - crop_h) / 2
+    box = (left, top, left + crop_w, top + crop_h)
+    return image.resize(size, Image.LANCZOS, box=box, reducing_gap=2.0)
+
+
+def open_base_image(path: Path | tuple[str, int], min_size: tuple[int, int]) -> Image.Image:
+    import cv2
+    from PIL import Image
+    from frame_stack import load_source, source_name
+    
+    frame = load_source(path, min_size)
+    if frame is None:
+        raise FileNotFoundError(f"File not found: {source_name(path)}")
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
 
+def render_thumbnail(image: Image.Image, caption: str, size: tuple[int, int], scale: float = 0.5) -> Image.Image:
+    base = fit_to_size(image, size).convert("RGBA")
+    base.alpha_composite(caption_layer(caption, size, round(scale, 4)))
+    return base
 
-def create_thumbnail(folder_name: str, caption: str, year: int) -> None:
+
+def create_thumbnails(
+    folder_name: str,
+    caption: str,
+    years: list[int],
+    profiles: list[str] | None = None
+) -> list[Path]:
+    from frame_stack import find_source, source_size
+    
     folder = Path(DEFAULT_OUTPUT_DIR, folder_name)
-    base_file = folder / f"{folder_name}_{year}.png"
+    profiles = profiles or list(THUMBNAIL_PROFILES)
+    saved = []
+    min_size = (
+        max(THUMBNAIL_PROFILES[p][0] for p in profiles),
+        max(THUMBNAIL_PROFILES[p][1] for p in profiles),
+    )
+
+    for year in years:
+        base_file = find_source(folder, folder_name, year)
+        try:
+            image = open_base_image(base_file, min_size)
+        except FileNotFoundError as e:
+            print(f"Error: {e}")
+            continue
+        except Exception as e:
+            print(f"Error opening image: {e}")
+            continue
+
+        src_w, src_h = source_size(base_file) or image.size
+        for profile in profiles:
+            size = THUMBNAIL_PROFILES[profile]
+            out_file = folder / f"{folder_name}_{year}_{profile}_thumbnail.png"
+            scale = max(size[0] / src_w, size[1] / src_h)
+            render_thumbnail(image, caption, size, scale).save(out_file)
+            saved.append(out_file)
+
+    print(f"Saved {len(saved)} thumbnails to {folder}")
+    return saved
+
+
+def create_thumbnail(folder_name: str, caption: str, year: int | None) -> None:
+    folder = Path(DEFAULT_OUTPUT_DIR, folder_name)
+    if year is None:
+        from frame_scoring import pick_best_year
+        try:
+            year = pick_best_year(folder, folder_name)
+        except FileNotFoundError:
+            year = None
+        if year is None:
+            print(f"Error: No yearly images found in {folder}")
+            return
+        print(f"Auto-selected {year} as the best frame")
+
+    from frame_stack import find_source, source_name, source_size
+    
+    base_file = find_source(folder, folder_name, year)
     out_file = folder / f"{folder_name}_thumbnail.png"
     
+    src_size = source_size(base_file)
+    if src_size is None:
+        print(f"Error: File not found: {source_name(base_file)}")
+        return
+    size = (src_size[0] // 2, src_size[1] // 2)
+
     try:
-        image = Image.open(base_file).convert("RGBA")
-    except FileNotFoundError:
-        print(f"Error: File not found: {base_file}")
+        image = open_base_image(base_file, size)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
         return
     except Exception as e:
         print(f"Error opening image: {e}")
         return
-    
-    try:
-        font_path = font_manager.findfont(font_manager.FontProperties(family="Arial"))
-        font = ImageFont.truetype(font_path, size=int(image.height / 5))
-    except Exception:
-        font = ImageFont.load_default()
-    
-    draw = ImageDraw.Draw(image)
-    lines = caption.split("\n")
-    line_spacing = int(font.size * 1.2)
-    line_sizes = [draw.textbbox((0, 0), line, font=font) for line in lines]
-    line_widths = [bbox[2] - bbox[0] for bbox in line_sizes]
-    line_heights = [bbox[3] - bbox[1] for bbox in line_sizes]
-    text_block_width = max(line_widths)
-    text_block_height = sum(line_heights) + line_spacing * (len(lines) - 1)
-    x_text = (image.width - text_block_width) // 2
-    y_text = (image.height - text_block_height) // 2
-    
-    current_y = y_text
-    for i, line in enumerate(lines):
-        line_width = line_widths[i]
-        x_line = (image.width - line_width) // 2
-        
-        draw.text(
-            (x_line, current_y),
-            line,
-            font=font,
-            fill=(255, 255, 255, 0),
-            stroke_width=10,
-            stroke_fill=(0, 0, 0, 255)
-        )
-        
-        draw.text(
-            (x_line, current_y),
-            line,
-            font=font,
-            fill=(255, 255, 255, 0),
-            stroke_width=4,
-            stroke_fill=(255, 55, 0, 255)
-        )
-        
-        draw.text(
-            (x_line, current_y),
-            line,
-            font=font,
-            fill=(255, 255, 255, 0),
-            stroke_width=2,
-            stroke_fill=(255, 255, 0, 255)
-        )
-        
-        draw.text(
-            (x_line, current_y),
-            line,
-            font=font,
-            fill=(255, 255, 255, 255)
-        )
-        
-        current_y += line_heights[i] + line_spacing
-    
-    new_size = (image.width // 2, image.height // 2)
-    image = image.resize(new_size, Image.LANCZOS)
-    image.save(out_file)
+
+    render_thumbnail(image, caption, size).save(out_file)
     print(f"Thumbnail saved to {out_file}")
 
 
@@ -1,39 +1,33 @@
-import ee
-import numpy as np
-import cv2
 import os
 import sys
-from datetime import datetime
+import time
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from utils import get_weather_inputs, DEFAULT_OUTPUT_DIR
+from utils import get_weather_inputs, get_ee, DEFAULT_OUTPUT_DIR
+from draft import get_profile
+from jobs import check_cancelled, report_progress
+from manifest import LEASE_SEC, JobManifest, input_hash
+from segment_encoder import SEGMENT_SEC, encode_timeline
+from tracing import set_trace_output, span, traced_job
+from weather_common import (
+    TEMP_MIN, TEMP_MAX, VIS_PALETTE, border_cache_path, draw_borders, draw_date, draw_legend, fetch_border_layers,
+    weather_request_size, month_dates, fetch_weather_stack, colorize
+)
 
-ee.Initialize(project='solid-bliss-390413')
-
-VIS_PALETTE = [
-    '#FFCCFF', '#F5496E', '#CC0000', '#FF0000', '#FF6600', '#FF9933', 
-    '#FFCC00', '#FFFF00', '#66FF33', '#93FFFF', '#66FFFF', '#69E1FD', 
-    '#5BADFF', '#0E6DC4', '#0000FF', '#9900FF', '#6600FF', '#2200B4', 
-    '#000099', '#000066'
-]
-TEMP_MIN = 223
-TEMP_MAX = 318
 
 FPS = 10
 OUT_W, OUT_H = 1920, 1080
+LEASE_POLL_SEC = 5
 
 
-def get_days_in_month(year: int, month: int) -> int:
-    if month == 12:
-        return 31
-    return (datetime(year, month + 1, 1) - datetime(year, month, 1)).days
-
-
-def hex_to_rgb(hex_color):
-    hex_color = hex_color.lstrip('#')
-    return tuple(int(hex_color[i:i+2], 16) for i in (4, 2, 0))
+def read_frame(path: str, context: None, cache: dict):
+    import cv2
+    
+    with span("decode", file=os.path.basename(path)):
+        return cv2.imread(path)
 
 
+@traced_job("weather_timelapse")
 def create_weather_timelapse(
     place_name: str,
     year: int,
@@ -41,8 +35,21 @@ def create_weather_timelapse(
     lat_top: float,
     lat_bottom: float,
     lon_left: float,
-    lon_right: float
+    lon_right: float,
+    keep_frames: bool = False,
+    workers: int | None = None,
+    segment_sec: float = SEGMENT_SEC,
+    draft: bool = False
 ) -> None:
+    import cv2
+    import numpy as np
+    
+    ee = get_ee()
+    profile = get_profile(draft)
+    out_w, out_h = profile.video_size if draft else (OUT_W, OUT_H)
+    fps = profile.weather_fps if draft else FPS
+    bounds = (lat_top, lat_bottom, lon_left, lon_right)
+    request_w, request_h = weather_request_size(bounds, (out_w, out_h))
     print("Starting weather timelapse generation...")
     
     polygon = ee.Geometry.Polygon([
@@ -52,200 +59,150 @@ def create_weather_timelapse(
          [lon_right, lat_bottom]]
     ])
     
-    days_in_month = get_days_in_month(year, month)
-    start_date = f"{year}-{month:02d}-01"
-    end_date = f"{year}-{month:02d}-{days_in_month:02d}"
+    start_date, end_date, days_in_month = month_dates(year, month)
     
     output_dir = os.path.join(DEFAULT_OUTPUT_DIR, place_name)
     os.makedirs(output_dir, exist_ok=True)
+    set_trace_output(output_dir)
+    out_file = os.path.join(output_dir, f"{place_name}_weather_{year}_{month:02d}{profile.suffix}.mp4")
     
-    print(f"Fetching weather data for {start_date} to {end_date}...")
-    
-    collection = (
-        ee.ImageCollection('NOAA/CFSV2/FOR6H')
-        .select('Temperature_height_above_ground')
-        .filter(ee.Filter.date(start_date, end_date))
+    manifest = JobManifest(output_dir, f"weather_{year}_{month:02d}{profile.suffix}")
+    job_hash = input_hash(
+        year, month, (lat_top, lat_bottom, lon_left, lon_right),
+        TEMP_MIN, TEMP_MAX, VIS_PALETTE, out_w, out_h, fps, request_w, request_h
     )
+    if manifest.is_done("video", job_hash):
+        print(f"Already rendered: {out_file}")
+        return
     
-    collection_list = collection.toList(collection.size().getInfo())
-    num_images = collection_list.length().getInfo()
+    print(f"Fetching weather data for {start_date} to {end_date}...")
     
-    if num_images == 0:
+    # Shared with get_weather_image: whichever runs first downloads the raw month, the other reads the cache.
+    stack = fetch_weather_stack(polygon, start_date, end_date, bounds, (request_w, request_h), output_dir)
+    if stack is None:
         print(f"No weather data found for {year}-{month:02d}")
         return
+    num_images = len(stack)
     
-    print(f"Found {num_images} images, processing frames...")
+    print(f"Rendering {num_images} timesteps from {request_w}x{request_h} data...")
     
-    import requests
     from PIL import Image
-    from io import BytesIO
-    
-    region = polygon.bounds().getInfo()['coordinates']
-    frame_files = []
     
-    states = ee.FeatureCollection('projects/ee-robertmaurer28/assets/states2')
+    # Border geometry is the same for every frame, so fetch it once.
+    border_layers = fetch_border_layers(polygon, border_cache_path(output_dir, bounds))
     
-    for i in range(num_images):
-        try:
-            img = ee.Image(collection_list.get(i))
-            
-            vis_image = img.visualize(
-                min=TEMP_MIN, max=TEMP_MAX, palette=','.join(VIS_PALETTE)
-            )
-            
-            url = vis_image.getThumbURL({
-                'region': region,
-                'dimensions': [OUT_W, OUT_H],
-                'format': 'png',
-            })
-            
-            response = requests.get(url)
-            pil_img = Image.open(BytesIO(response.content))
-            pil_img = pil_img.convert('RGB')
-            pil_img = pil_img.resize((OUT_W, OUT_H), Image.LANCZOS)
+    def render_frame(i: int, frame_path: str) -> None:
+        with span("decode", frame=i):
+            pil_img = Image.fromarray(colorize(stack[i]))
+            pil_img = pil_img.resize((out_w, out_h), Image.BILINEAR if profile.fast_resample else Image.LANCZOS)
             
             img_np = np.array(pil_img)
-            
-            h, w = img_np.shape[:2]
-            
-            try:
-                state_fc = states.filterBounds(polygon)
-                state_list = state_fc.toList(100).getInfo()
-                
-                for feat in state_list:
-                    geom = feat['geometry']
-                    if geom['type'] == 'Polygon':
-                        coords = geom['coordinates'][0]
-                        points = np.array([[
-                            int((lon - lon_left) / (lon_right - lon_left) * w),
-                            int((lat_top - lat) / (lat_top - lat_bottom) * h)
-                        ] for lon, lat in coords], np.int32)
-                        cv2.polylines(img_np, [points], True, (80, 80, 80), 2)
-                    elif geom['type'] == 'MultiPolygon':
-                        for poly in geom['coordinates']:
-                            coords = poly[0]
-                            points = np.array([[
-                                int((lon - lon_left) / (lon_right - lon_left) * w),
-                                int((lat_top - lat) / (lat_top - lat_bottom) * h)
-                            ] for lon, lat in coords], np.int32)
-                            cv2.polylines(img_np, [points], True, (80, 80, 80), 2)
-            except Exception as e:
-                print(f"Error drawing states: {e}")
-            
-            # Add Mexico borders
-            try:
-                mexico = ee.FeatureCollection('USDOS/LSIB_SIMPLE/2017').filter(ee.Filter.eq('adm0_name', 'Mexico'))
-                mexico_fc = mexico.filterBounds(polygon)
-                mexico_list = mexico_fc.toList(10).getInfo()
-                
-                for feat in mexico_list:
-                    geom = feat['geometry']
-                    if geom['type'] == 'Polygon':
-                        coords = geom['coordinates'][0]
-                        points = np.array([[
-                            int((lon - lon_left) / (lon_right - lon_left) * w),
-                            int((lat_top - lat) / (lat_top - lat_bottom) * h)
-                        ] for lon, lat in coords], np.int32)
-                        cv2.polylines(img_np, [points], True, (0, 0, 0), 3)
-                    elif geom['type'] == 'MultiPolygon':
-                        for poly in geom['coordinates']:
-                            coords = poly[0]
-                            points = np.array([[
-                                int((lon - lon_left) / (lon_right - lon_left) * w),
-                                int((lat_top - lat) / (lat_top - lat_bottom) * h)
-                            ] for lon, lat in coords], np.int32)
-                            cv2.polylines(img_np, [points], True, (0, 0, 0), 3)
-            except Exception as e:
-                print(f"Error drawing Mexico: {e}")
-            
-            # Add coast borders
-            try:
-                coaster = ee.FeatureCollection('projects/ee-robertmaurer28/assets/coaster')
-                coast_fc = coaster.filterBounds(polygon)
-                coast_list = coast_fc.toList(50).getInfo()
-                
-                for feat in coast_list:
-                    geom = feat['geometry']
-                    if geom['type'] == 'Polygon':
-                        coords = geom['coordinates'][0]
-                        points = np.array([[
-                            int((lon - lon_left) / (lon_right - lon_left) * w),
-                            int((lat_top - lat) / (lat_top - lat_bottom) * h)
-                        ] for lon, lat in coords], np.int32)
-                        cv2.polylines(img_np, [points], True, (0, 0, 0), 3)
-                    elif geom['type'] == 'MultiPolygon':
-                        for poly in geom['coordinates']:
-                            coords = poly[0]
-                            points = np.array([[
-                                int((lon - lon_left) / (lon_right - lon_left) * w),
-                                int((lat_top - lat) / (lat_top - lat_bottom) * h)
-                            ] for lon, lat in coords], np.int32)
-                            cv2.polylines(img_np, [points], True, (0, 0, 0), 3)
-            except Exception as e:
-                print(f"Error drawing coast: {e}")
+        
+        with span("overlay", frame=i):
+            draw_borders(img_np, border_layers, bounds)
             
             day_num = (i * days_in_month) // num_images + 1
             day_num = min(day_num, days_in_month)
-            date_str = f"{day_num:02d}-{month:02d}-{year}"
-            cv2.putText(img_np, date_str, (w - 200, h - 50), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3, cv2.LINE_AA)
-            
-            legend_w = 400
-            legend_h = 30
-            legend_x = 50
-            legend_y = h - 100
-            
-            for j in range(legend_w):
-                t = j / legend_w
-                temp_k = TEMP_MIN + t * (TEMP_MAX - TEMP_MIN)
-                idx = int(t * (len(VIS_PALETTE) - 1))
-                color = hex_to_rgb(VIS_PALETTE[idx])
-                cv2.line(img_np, (legend_x + j, legend_y), (legend_x + j, legend_y + legend_h), color, 1)
-            
-            temps_c = [int(TEMP_MIN - 273.15), int(TEMP_MAX - 273.15)]
-            cv2.putText(img_np, f"{temps_c[0]}C", (legend_x, legend_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2, cv2.LINE_AA)
-            cv2.putText(img_np, f"{temps_c[1]}C", (legend_x + legend_w - 50, legend_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2, cv2.LINE_AA)
-            
-            frame_path = os.path.join(output_dir, f"weather_frame_{i:04d}.png")
+            draw_date(img_np, f"{day_num:02d}-{month:02d}-{year}")
+            draw_legend(img_np)
+        
+        with span("disk_write", frame=i):
             cv2.imwrite(frame_path, img_np)
-            frame_files.append(frame_path)
-            
-            if (i + 1) % 10 == 0:
-                print(f"Processed {i + 1}/{num_images} frames")
-                
-        except Exception as e:
-            print(f"Error processing frame {i}: {e}")
-            continue
     
+    frames = {}
+    leased = []
+    # Frames leased by another worker are retried until it finishes them or its lease expires.
+    deadline = time.time() + LEASE_SEC + LEASE_POLL_SEC
+    pending = list(range(0, num_images, profile.weather_stride))
+    while pending:
+        for i in pending:
+            check_cancelled()
+            report_progress(len(frames), len(pending) + len(frames), f"frame {i + 1}/{num_images}")
+            unit = f"frame_{i:04d}"
+            frame_path = os.path.join(output_dir, f"weather_frame{profile.suffix}_{i:04d}.png")
+            frame_hash = input_hash(job_hash, i)
+            if not manifest.claim(unit, frame_hash):
+                if manifest.is_done(unit, frame_hash):
+                    frames[i] = frame_path
+                else:
+                    leased.append(i)
+                continue
+            try:
+                render_frame(i, frame_path)
+                manifest.complete(unit, frame_path)
+                frames[i] = frame_path
+                
+                if (i + 1) % 10 == 0:
+                    print(f"Processed {i + 1}/{num_images} frames")
+                    
+            except Exception as e:
+                manifest.fail(unit, str(e))
+                print(f"Error processing frame {i}: {e}")
+                continue
+        
+        pending, leased = leased, []
+        if pending:
+            if time.time() > deadline:
+                print(f"Frames {pending} are still being rendered by another worker; not creating the video")
+                return
+            print(f"Waiting for {len(pending)} frames being rendered by another worker...")
+            time.sleep(LEASE_POLL_SEC)
+    
+    frame_files = [frames[i] for i in sorted(frames)]
     if len(frame_files) < 2:
         print("Not enough frames to create video")
         return
     
+    if not manifest.claim("video", job_hash):
+        if manifest.is_done("video", job_hash):
+            print(f"Already rendered: {out_file}")
+        else:
+            print("The video is being created by another worker, skipping")
+        return
     print("Creating video...")
-    out_file = os.path.join(output_dir, f"{place_name}_weather_{year}_{month:02d}.mp4")
-    
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    writer = cv2.VideoWriter(out_file, fourcc, FPS, (OUT_W, OUT_H))
-    
-    for frame_file in frame_files:
-        frame = cv2.imread(frame_file)
-        if frame is not None:
-            writer.write(frame)
-    
-    writer.release()
     
-    for frame_file in frame_files:
-        try:
-            os.remove(frame_file)
-        except:
-            pass
+    runs = [(frame_file, 1) for frame_file in frame_files]
+    try:
+        encode_timeline(out_file, runs, read_frame, None, fps, (out_w, out_h), workers, segment_sec)
+    except BaseException as e:
+        manifest.fail("video", str(e))
+        raise
+    manifest.complete("video", out_file)
+    
+    if not keep_frames:
+        for frame_file in frame_files:
+            try:
+                os.remove(frame_file)
+            except:
+                pass
     
     print(f"Done! Video saved: {out_file}")
 
 
+def create_weather_products(
+    place_name: str,
+    year: int,
+    month: int,
+    lat_top: float,
+    lat_bottom: float,
+    lon_left: float,
+    lon_right: float,
+    draft: bool = False,
+    aggregate: str = "median"
+) -> None:
+    from Weather_image import get_weather_image
+    
+    # The still downloads the raw month and borders once; the timelapse reads both from the cache.
+    get_weather_image(place_name, year, month, lat_top, lat_bottom, lon_left, lon_right, draft=draft, aggregate=aggregate)
+    create_weather_timelapse(place_name, year, month, lat_top, lat_bottom, lon_left, lon_right, draft=draft)
+
+
 if __name__ == "__main__":
     try:
         place_name, year, month, lat_top, lat_bottom, lon_left, lon_right = get_weather_inputs()
-        create_weather_timelapse(place_name, year, month, lat_top, lat_bottom, lon_left, lon_right)
+        create_weather_products(
+            place_name, year, month, lat_top, lat_bottom, lon_left, lon_right, draft="--draft" in sys.argv
+        )
     except Exception as e:
         print(f"Error: {e}")
         import traceback
@@ -0,0 +1,180 @@
+import os
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fonts import find_font
+
+# The rendering paths as they were before the performance work, kept only as the reference that
+# benchmark.py checks the optimized output against. Constants are frozen at their original values.
+
+FPS = 30
+TITLE_SEC = 5
+END_PAUSE_SEC = 6.75
+HOLD_SEC = 2
+FAST_IMG_SEC = 0.35
+SLOW_IMG_SEC = 1.0
+OUT_W, OUT_H = 1920, 1080
+
+VIS_PALETTE = [
+    '#FFCCFF', '#F5496E', '#CC0000', '#FF0000', '#FF6600', '#FF9933',
+    '#FFCC00', '#FFFF00', '#66FF33', '#93FFFF', '#66FFFF', '#69E1FD',
+    '#5BADFF', '#0E6DC4', '#0000FF', '#9900FF', '#6600FF', '#2200B4',
+    '#000099', '#000066'
+]
+TEMP_MIN = 223
+TEMP_MAX = 318
+
+
+def frames(sec: float) -> int:
+    return int(round(FPS * sec))
+
+
+def hex_to_rgb(hex_color):
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (4, 2, 0))
+
+
+def font(family: str, filename: str, size: int) -> ImageFont.FreeTypeFont:
+    path = find_font(family, filename)
+    return ImageFont.truetype(path, size) if path else ImageFont.load_default(size)
+
+
+def make_title_frame(bg_img: np.ndarray, title: str, start_year: int, stop_year: int) -> np.ndarray:
+    lines = [title, "Time Lapse", f"{start_year} – {stop_year}"]
+
+    pil = Image.fromarray(cv2.cvtColor(bg_img, cv2.COLOR_BGR2RGB))
+    draw = ImageDraw.Draw(pil)
+    pil_font = font("DejaVu Sans", "DejaVuSans.ttf", 120)
+    line_spacing = 35
+
+    text_heights = [draw.textbbox((0, 0), line, font=pil_font)[3] for line in lines]
+    total_h = sum(text_heights) + line_spacing * (len(lines) - 1)
+    y = (OUT_H - total_h) // 2
+
+    for txt, t_h in zip(lines, text_heights):
+        bbox = draw.textbbox((0, 0), txt, font=pil_font)
+        x = (OUT_W - bbox[2]) // 2
+        draw.text((x, y), txt, font=pil_font, fill=(255, 255, 255))
+        y += t_h + line_spacing
+
+    return cv2.cvtColor(np.array(pil), cv2.COLOR_RGB2BGR)
+
+
+def make_thanks_frame(last_frame: np.ndarray) -> np.ndarray:
+    thanks_text = "Thanks for watching"
+    thanks_font = font("DejaVu Sans", "DejaVuSans.ttf", 125)
+
+    thanks_pil = Image.fromarray(cv2.cvtColor(last_frame, cv2.COLOR_BGR2RGB))
+    draw = ImageDraw.Draw(thanks_pil)
+    bbox = draw.textbbox((0, 0), thanks_text, font=thanks_font)
+    x_thanks = (OUT_W - bbox[2]) // 2
+    y_thanks = OUT_H - 500
+    draw.text((x_thanks, y_thanks - bbox[3]), thanks_text, font=thanks_font, fill=(255, 255, 255))
+    return cv2.cvtColor(np.array(thanks_pil), cv2.COLOR_RGB2BGR)
+
+
+def video_frames(files: list[Path], title: str, start_year: int, stop_year: int):
+    def read(path: Path) -> np.ndarray:
+        frame = cv2.imread(str(path))
+        if frame.shape[:2] != (OUT_H, OUT_W):
+            # The original passed INTER_AREA as the dst argument, so frames were resized bilinearly.
+            frame = cv2.resize(frame, (OUT_W, OUT_H), cv2.INTER_AREA)
+        return frame
+
+    label_pos = (20, OUT_H - 40)
+
+    def labelled(frame: np.ndarray, label: str) -> np.ndarray:
+        frame = frame.copy()
+        cv2.putText(frame, label, label_pos, cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3, cv2.LINE_AA)
+        return frame
+
+    first = read(files[0])
+    yield make_title_frame(first.copy(), title, start_year, stop_year), frames(TITLE_SEC)
+    for idx, path in enumerate(files):
+        yield labelled(read(path), "fast"), frames(HOLD_SEC) if idx == 0 else frames(FAST_IMG_SEC)
+    last_plain = read(files[-1])
+    for frame in (last_plain, first, last_plain, first):
+        yield frame, frames(HOLD_SEC)
+    last_frame = None
+    for path in files:
+        last_frame = labelled(read(path), "slow")
+        yield last_frame, frames(SLOW_IMG_SEC)
+    yield last_frame, frames(HOLD_SEC)
+    yield make_thanks_frame(last_frame), frames(END_PAUSE_SEC)
+
+
+def create_video(files: list[Path], title: str, start_year: int, stop_year: int, outfile: Path) -> None:
+    writer = cv2.VideoWriter(str(outfile), cv2.VideoWriter_fourcc(*"mp4v"), FPS, (OUT_W, OUT_H))
+    for frame, repeat in video_frames(files, title, start_year, stop_year):
+        for _ in range(repeat):
+            writer.write(frame)
+    writer.release()
+
+
+def create_thumbnail(base_file: Path, caption: str) -> np.ndarray:
+    image = Image.open(base_file).convert("RGBA")
+    thumb_font = font("Arial", "arial.ttf", int(image.height / 5))
+
+    draw = ImageDraw.Draw(image)
+    lines = caption.split("\n")
+    line_spacing = int(thumb_font.size * 1.2)
+    line_sizes = [draw.textbbox((0, 0), line, font=thumb_font) for line in lines]
+    line_widths = [bbox[2] - bbox[0] for bbox in line_sizes]
+    line_heights = [bbox[3] - bbox[1] for bbox in line_sizes]
+    text_block_height = sum(line_heights) + line_spacing * (len(lines) - 1)
+
+    current_y = (image.height - text_block_height) // 2
+    for line, line_width, line_height in zip(lines, line_widths, line_heights):
+        x_line = (image.width - line_width) // 2
+        for stroke_width, stroke_fill in ((10, (0, 0, 0, 255)), (4, (255, 55, 0, 255)), (2, (255, 255, 0, 255))):
+            draw.text(
+                (x_line, current_y), line, font=thumb_font, fill=(255, 255, 255, 0),
+                stroke_width=stroke_width, stroke_fill=stroke_fill
+            )
+        draw.text((x_line, current_y), line, font=thumb_font, fill=(255, 255, 255, 255))
+        current_y += line_height + line_spacing
+
+    image = image.resize((image.width // 2, image.height // 2), Image.LANCZOS)
+    return cv2.cvtColor(np.array(image.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+
+def draw_borders(
+    img_np: np.ndarray,
+    layers: list[tuple[list[dict], tuple[int, int, int], int]],
+    bounds: tuple[float, float, float, float]
+) -> None:
+    lat_top, lat_bottom, lon_left, lon_right = bounds
+    h, w = img_np.shape[:2]
+    for features, color, thickness in layers:
+        for feat in features:
+            geom = feat['geometry']
+            polys = [geom['coordinates']] if geom['type'] == 'Polygon' else geom['coordinates']
+            for poly in polys:
+                points = np.array([[
+                    int((lon - lon_left) / (lon_right - lon_left) * w),
+                    int((lat_top - lat) / (lat_top - lat_bottom) * h)
+                ] for lon, lat in poly[0]], np.int32)
+                cv2.polylines(img_np, [points], True, color, thickness)
+
+
+def draw_legend(img_np: np.ndarray) -> None:
+    h = img_np.shape[0]
+    legend_w = 400
+    legend_h = 30
+    legend_x = 50
+    legend_y = h - 100
+
+    for j in range(legend_w):
+        t = j / legend_w
+        idx = int(t * (len(VIS_PALETTE) - 1))
+        color = hex_to_rgb(VIS_PALETTE[idx])
+        cv2.line(img_np, (legend_x + j, legend_y), (legend_x + j, legend_y + legend_h), color, 1)
+
+    temps_c = [int(TEMP_MIN - 273.15), int(TEMP_MAX - 273.15)]
+    cv2.putText(img_np, f"{temps_c[0]}C", (legend_x, legend_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2, cv2.LINE_AA)
+    cv2.putText(img_np, f"{temps_c[1]}C", (legend_x + legend_w - 50, legend_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2, cv2.LINE_AA)
@@ -0,0 +1,298 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCH_ROOT = tempfile.mkdtemp(prefix="satellite_bench_")
+os.environ["SATELLITE_OUTPUT_DIR"] = BENCH_ROOT
+sys.path.insert(0, HERE)
+
+import cv2
+import numpy as np
+
+import Satellite_video
+import Video_thumbnail
+import bench_reference
+import tracing
+import weather_common
+
+FRAME_SIZES = [(960, 960), (1600, 1600), (2500, 2500)]
+FRAME_COUNTS = [5, 20]
+FEATURE_COUNTS = [50, 500]
+REPEATS = 5
+GOLDEN_MIN_PSNR = 35.0
+# Captions are now drawn at thumbnail size, where the 1px stroke rings land on the pixel grid instead
+# of being averaged down from the full frame; the rest of the thumbnail is held to GOLDEN_MIN_PSNR.
+GOLDEN_MIN_PSNR_BY_NAME = {"thumbnail_caption": 21.0}
+WEATHER_BOUNDS = (52.0, 24.0, -125.0, -66.0)
+
+
+def process_peak_rss_mb() -> float | None:
+    # High-water mark of the whole benchmark process so far, not of one stage.
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except Exception:
+        return None
+
+
+def synthetic_frame(width: int, height: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        127 + 100 * np.sin(x / (37 + seed) + seed),
+        127 + 100 * np.cos(y / (53 + seed)),
+        127 + 100 * np.sin((x + y) / 71),
+    ], axis=-1)
+    noise = rng.normal(0, 12, (height, width, 3))
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def synthetic_features(count: int, vertices: int, seed: int) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    lat_top, lat_bottom, lon_left, lon_right = WEATHER_BOUNDS
+    features = []
+    for i in range(count):
+        cx = rng.uniform(lon_left, lon_right)
+        cy = rng.uniform(lat_bottom, lat_top)
+        angles = np.linspace(0, 2 * np.pi, vertices)
+        radius = rng.uniform(0.5, 3.0) * (1 + 0.2 * rng.random(vertices))
+        ring = np.stack([cx + radius * np.cos(angles), cy + radius * np.sin(angles)], axis=1).tolist()
+        if i % 4 == 0:
+            geometry = {"type": "MultiPolygon", "coordinates": [[ring], [ring[::2]]]}
+        else:
+            geometry = {"type": "Polygon", "coordinates": [ring]}
+        features.append({"type": "Feature", "geometry": geometry, "properties": {}})
+    return features
+
+
+def write_place(place_name: str, size: tuple[int, int], count: int) -> list[int]:
+    folder = Path(BENCH_ROOT, place_name)
+    folder.mkdir(parents=True, exist_ok=True)
+    years = list(range(2000, 2000 + count))
+    for i, year in enumerate(years):
+        cv2.imwrite(str(folder / f"{place_name}_{year}.png"), synthetic_frame(*size, seed=i))
+    return years
+
+
+def peak_alloc_mb(func) -> float:
+    # One extra, untimed call under tracemalloc, which sees numpy buffers but slows everything down.
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def timed(func, repeats: int = REPEATS) -> tuple[float, object]:
+    times = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def record(
+    results: list[dict],
+    stage: str,
+    params: dict,
+    wall_s: float,
+    frames: int | None = None,
+    stages: dict[str, float] | None = None,
+    alloc_mb: float | None = None
+) -> None:
+    entry = {
+        "stage": stage,
+        "params": params,
+        "wall_s": round(wall_s, 6),
+        "fps": round(frames / wall_s, 2) if frames and wall_s > 0 else None,
+        "peak_alloc_mb": round(alloc_mb, 1) if alloc_mb is not None else None,
+        "process_peak_rss_mb": process_peak_rss_mb(),
+        "stages": {name: round(total, 6) for name, total in (stages or {}).items()},
+    }
+    results.append(entry)
+    fps = f"{entry['fps']:>9.1f}" if entry["fps"] else f"{'-':>9}"
+    print(f"{stage:<18}{json.dumps(params):<40}{wall_s * 1000:>10.1f} ms{fps} fps")
+
+
+def read_middle_frame(video_path: Path) -> np.ndarray | None:
+    cap = cv2.VideoCapture(str(video_path))
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.set(cv2.CAP_PROP_POS_FRAMES, total // 2)
+    ok, frame = cap.read()
+    cap.release()
+    return frame if ok else None
+
+
+def run_benchmarks(
+    sizes,
+    counts,
+    feature_counts,
+    memory: bool = False
+) -> tuple[list[dict], dict[str, tuple[np.ndarray, np.ndarray]]]:
+    results = []
+    # name -> (optimized output, output of the pre-optimization path on the same input)
+    golden = {}
+
+    def alloc(func) -> float | None:
+        return peak_alloc_mb(func) if memory else None
+
+    bg = cv2.resize(synthetic_frame(*sizes[0], seed=0), (Satellite_video.OUT_W, Satellite_video.OUT_H))
+    title = lambda: Satellite_video.make_title_frame(bg.copy(), "Benchmark Bay", 2000, 2024)
+    wall, frame = timed(title)
+    record(results, "make_title_frame", {"size": [Satellite_video.OUT_W, Satellite_video.OUT_H]}, wall, 1, alloc_mb=alloc(title))
+    golden["title_frame"] = frame, bench_reference.make_title_frame(bg.copy(), "Benchmark Bay", 2000, 2024)
+
+    for size in sizes:
+        for count in counts:
+            place = f"bench_{size[0]}x{size[1]}_{count}"
+            years = write_place(place, size, count)
+            video = lambda: Satellite_video.create_video(place, "Benchmark Bay", years[0], years[-1])
+            start = time.perf_counter()
+            video()
+            wall = time.perf_counter() - start
+            stages = tracing.last_trace.stage_totals() if tracing.last_trace else None
+            record(
+                results, "create_video", {"size": list(size), "images": count}, wall,
+                Satellite_video.video_frame_count(count), stages, alloc(video)
+            )
+            if size == sizes[0] and count == counts[0]:
+                folder = Path(BENCH_ROOT, place)
+                reference = folder / "reference.mp4"
+                files = [folder / f"{place}_{year}.png" for year in years]
+                bench_reference.create_video(files, "Benchmark Bay", years[0], years[-1], reference)
+                frame = read_middle_frame(folder / f"{place}_TimeLapse.mp4")
+                expected = read_middle_frame(reference)
+                if frame is not None and expected is not None:
+                    golden["video_middle_frame"] = frame, expected
+
+        place = f"bench_{size[0]}x{size[1]}_{counts[0]}"
+        thumbnail = lambda: Video_thumbnail.create_thumbnail(place, "Benchmark Bay\nTimelapse", 2000)
+        wall, _ = timed(thumbnail)
+        record(results, "create_thumbnail", {"size": list(size)}, wall, 1, alloc_mb=alloc(thumbnail))
+        if size == sizes[0]:
+            folder = Path(BENCH_ROOT, place)
+            frame = cv2.imread(str(folder / f"{place}_thumbnail.png"))
+            expected = bench_reference.create_thumbnail(folder / f"{place}_2000.png", "Benchmark Bay\nTimelapse")
+            plain = bench_reference.create_thumbnail(folder / f"{place}_2000.png", "")
+            caption = cv2.dilate((np.abs(expected.astype(int) - plain).max(axis=2) > 0).astype(np.uint8), np.ones((5, 5)))
+            background = frame.copy()
+            background[caption > 0] = expected[caption > 0]
+            golden["thumbnail"] = background, expected
+            golden["thumbnail_caption"] = frame, expected
+
+    canvas = np.zeros((1080, 1920, 3), np.uint8)
+    for count in feature_counts:
+        features = synthetic_features(count, 200, seed=count)
+        layers = [(features, (80, 80, 80), 2), (features[: count // 10], (0, 0, 0), 3)]
+
+        def borders(draw=weather_common.draw_borders):
+            img = canvas.copy()
+            draw(img, layers, WEATHER_BOUNDS)
+            return img
+
+        wall, img = timed(borders)
+        record(results, "weather_borders", {"features": count, "vertices": 200}, wall, 1, alloc_mb=alloc(borders))
+        if count == feature_counts[0]:
+            golden["weather_borders"] = img, borders(bench_reference.draw_borders)
+
+    def legend(draw=weather_common.draw_legend):
+        img = canvas.copy()
+        draw(img)
+        return img
+
+    wall, img = timed(legend)
+    record(results, "weather_legend", {"size": [1920, 1080]}, wall, 1, alloc_mb=alloc(legend))
+    golden["weather_legend"] = img, legend(bench_reference.draw_legend)
+
+    return results, golden
+
+
+def psnr(a: np.ndarray, b: np.ndarray) -> float:
+    if a.shape != b.shape:
+        return 0.0
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def check_golden(golden: dict[str, tuple[np.ndarray, np.ndarray]], diff_dir: Path | None = None) -> bool:
+    ok = True
+    for name, (frame, expected) in golden.items():
+        value = psnr(frame, expected)
+        passed = value >= GOLDEN_MIN_PSNR_BY_NAME.get(name, GOLDEN_MIN_PSNR)
+        ok = ok and passed
+        print(f"golden {name}: PSNR {value:.1f} dB against the reference path {'ok' if passed else 'FAIL'}")
+        if not passed and diff_dir:
+            diff_dir.mkdir(parents=True, exist_ok=True)
+            cv2.imwrite(str(diff_dir / f"{name}_optimized.png"), frame)
+            cv2.imwrite(str(diff_dir / f"{name}_reference.png"), expected)
+    return ok
+
+
+def compare(results: list[dict], baseline_file: Path) -> None:
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["stage"], json.dumps(r["params"], sort_keys=True)): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline_file}:")
+    for r in results:
+        old = previous.get((r["stage"], json.dumps(r["params"], sort_keys=True)))
+        if old is None:
+            continue
+        ratio = r["wall_s"] / old["wall_s"] if old["wall_s"] else float("inf")
+        print(f"{r['stage']:<18}{json.dumps(r['params']):<40}{ratio:>8.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark rendering, encoding and overlay hot paths.")
+    parser.add_argument("--out", default=os.path.join(HERE, "bench_results"), help="Folder for JSON results")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--diff-dir", help="Folder to write optimized and reference images that fail the golden check")
+    parser.add_argument("--memory", action="store_true", help="Also measure each stage's peak allocations (one extra untimed run)")
+    parser.add_argument("--quick", action="store_true", help="Smallest sizes only")
+    args = parser.parse_args()
+
+    sizes = FRAME_SIZES[:1] if args.quick else FRAME_SIZES
+    counts = FRAME_COUNTS[:1] if args.quick else FRAME_COUNTS
+    feature_counts = FEATURE_COUNTS[:1] if args.quick else FEATURE_COUNTS
+
+    results, golden = run_benchmarks(sizes, counts, feature_counts, args.memory)
+
+    os.makedirs(args.out, exist_ok=True)
+    out_file = Path(args.out, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(out_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "meta": {
+                "timestamp": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "opencv": cv2.__version__,
+                "numpy": np.__version__,
+            },
+            "results": results,
+        }, f, indent=1)
+    print(f"\nResults saved: {out_file}")
+
+    if args.compare:
+        compare(results, Path(args.compare))
+
+    golden_ok = check_golden(golden, Path(args.diff_dir) if args.diff_dir else None)
+    shutil.rmtree(BENCH_ROOT, ignore_errors=True)
+    sys.exit(0 if golden_ok else 1)
@@ -0,0 +1,28 @@
+from dataclasses import dataclass
+
+DRAFT_DIR = "draft"
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    name: str
+    image_dimensions: int
+    video_size: tuple[int, int]
+    video_fps: int
+    weather_fps: int
+    weather_stride: int
+    fast_resample: bool
+    transfer_format: str
+
+    @property
+    def suffix(self) -> str:
+        return "" if self.name == "final" else f"_{self.name}"
+
+
+FINAL = RenderProfile("final", 2500, (1920, 1080), 30, 10, 1, False, "png")
+# Same timing as the final render at a fraction of the pixels and frames.
+DRAFT = RenderProfile("draft", 480, (960, 540), 10, 5, 2, True, "jpg")
+
+
+def get_profile(draft: bool = False) -> RenderProfile:
+    return DRAFT if draft else FINAL
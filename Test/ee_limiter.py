@@ -0,0 +1,164 @@
+import random
+import threading
+import time
+from typing import Any, Callable
+
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+TRANSIENT_MARKERS = (
+    "too many concurrent aggregations",
+    "too many requests",
+    "rate limit",
+    "quota exceeded",
+    "resource exhausted",
+    "service unavailable",
+    "deadline exceeded",
+    "timed out",
+    "connection reset",
+    "connection aborted",
+    "internal error",
+)
+TRANSIENT_EXCEPTIONS = ("ConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout", "ChunkedEncodingError")
+
+
+def classify_error(exc: BaseException) -> str:
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is None and isinstance(getattr(exc, "code", None), int):
+        status = exc.code
+    if status in TRANSIENT_STATUS:
+        return "transient"
+    if status is not None and 400 <= status < 500:
+        return "permanent"
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return "transient"
+    if any(cls.__name__ in TRANSIENT_EXCEPTIONS for cls in type(exc).__mro__):
+        return "transient"
+    message = str(exc).lower()
+    if any(marker in message for marker in TRANSIENT_MARKERS):
+        return "transient"
+    return "permanent"
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        initial_concurrency: int = 2,
+        min_concurrency: int = 1,
+        max_concurrency: int = 16,
+        rate: float = 20.0,
+        burst: int = 10,
+        max_retries: int = 8,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        decrease_factor: float = 0.5,
+    ):
+        self.limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "failed": 0}
+        self._epoch = 0
+        self._cond = threading.Condition()
+
+    def _acquire(self) -> tuple[int, bool]:
+        self.bucket.acquire()
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            self.stats["calls"] += 1
+            saturated = self.in_flight >= int(self.limit)
+            epoch = self._epoch
+        return epoch, saturated
+
+    def _release(self, outcome: str, epoch: int, saturated: bool) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == "ok":
+                # Additive increase of about one slot per full window, only while the window is the bottleneck.
+                if saturated:
+                    self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            elif outcome == "transient":
+                self.stats["throttled"] += 1
+                # Calls started before the last decrease saw the old window; halve once per window, not per 429.
+                if epoch == self._epoch:
+                    self.limit = max(self.min_concurrency, self.limit * self.decrease_factor)
+                    self._epoch += 1
+            self._cond.notify_all()
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        attempt = 0
+        while True:
+            epoch, saturated = self._acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                kind = classify_error(e)
+                self._release(kind, epoch, saturated)
+                if kind == "permanent" or attempt >= self.max_retries:
+                    with self._cond:
+                        self.stats["failed"] += 1
+                    raise
+                with self._cond:
+                    self.stats["retries"] += 1
+                time.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            self._release("ok", epoch, saturated)
+            return result
+
+
+_limiter_lock = threading.Lock()
+_limiter: AdaptiveLimiter | None = None
+
+
+def get_limiter() -> AdaptiveLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = AdaptiveLimiter()
+    return _limiter
+
+
+def ee_call(func: Callable[..., Any], *args, **kwargs) -> Any:
+    return get_limiter().call(func, *args, **kwargs)
+
+
+def http_get(url: str, **kwargs):
+    import requests
+
+    def fetch():
+        response = requests.get(url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    return get_limiter().call(fetch)
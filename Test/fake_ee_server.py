@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from ee_limiter import AdaptiveLimiter
+
+MAX_CONCURRENT = 4
+RATE_PER_SEC = 30.0
+LATENCY_SEC = 0.05
+
+
+def synthetic_png(width: int, height: int, seed: int = 0) -> bytes:
+    rows = b"".join(
+        b"\x00" + bytes(((x + seed) % 256, (y * 2) % 256, (x + y) % 256)[c] for x in range(width) for c in range(3))
+        for y in range(height)
+    )
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+class QuotaState:
+    def __init__(self, max_concurrent: int, rate: float, latency: float):
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.latency = latency
+        self.active = 0
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.stats = {"ok": 0, "rejected_concurrency": 0, "rejected_rate": 0}
+        self.lock = threading.Lock()
+
+    def admit(self) -> str | None:
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1.0:
+                self.window_start = now
+                self.window_count = 0
+            if self.active >= self.max_concurrent:
+                self.stats["rejected_concurrency"] += 1
+                return "Too many concurrent aggregations."
+            if self.window_count >= self.rate:
+                self.stats["rejected_rate"] += 1
+                return "Too many requests. Quota exceeded."
+            self.active += 1
+            self.window_count += 1
+            return None
+
+    def release(self) -> None:
+        with self.lock:
+            self.active -= 1
+            self.stats["ok"] += 1
+
+
+class FakeEEHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        state = self.server.state
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path != "/thumb":
+            self.reply(404, "application/json", json.dumps({"error": {"code": 404, "message": "Not found"}}).encode())
+            return
+
+        rejection = state.admit()
+        if rejection:
+            self.reply(429, "application/json", json.dumps({"error": {"code": 429, "message": rejection}}).encode())
+            return
+        try:
+            time.sleep(state.latency)
+            width = int(params.get("w", ["64"])[0])
+            height = int(params.get("h", ["64"])[0])
+            seed = int(params.get("seed", ["0"])[0])
+            self.reply(200, "image/png", synthetic_png(width, height, seed))
+        finally:
+            state.release()
+
+    def reply(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGeometry:
+    def __init__(self, coordinates: list):
+        self.coordinates = coordinates
+
+    def bounds(self) -> "FakeGeometry":
+        return self
+
+    def getInfo(self) -> dict:
+        return {"type": "Polygon", "coordinates": self.coordinates}
+
+
+class FakeImage:
+    def __init__(self, thumb_url: str, year: int):
+        self.thumb_url = thumb_url
+        self.year = year
+
+    def select(self, bands: list[str]) -> "FakeImage":
+        return self
+
+    def getThumbURL(self, params: dict) -> str:
+        region = params["region"]
+        points = (region.coordinates if isinstance(region, FakeGeometry) else region)[0]
+        lon_span = max(p[0] for p in points) - min(p[0] for p in points)
+        lat_span = max(p[1] for p in points) - min(p[1] for p in points)
+        # Like Earth Engine, an integer dimension sets the long side and keeps the region's aspect.
+        long_side = int(params["dimensions"])
+        short_side = max(1, round(long_side * min(lon_span, lat_span) / max(lon_span, lat_span)))
+        w, h = (long_side, short_side) if lon_span >= lat_span else (short_side, long_side)
+        return f"{self.thumb_url}?w={w}&h={h}&seed={self.year}"
+
+
+class FakeCollection:
+    def __init__(self, thumb_url: str, year: int = 0):
+        self.thumb_url = thumb_url
+        self.year = year
+
+    def filterDate(self, start: str, end: str) -> "FakeCollection":
+        return FakeCollection(self.thumb_url, int(start[:4]))
+
+    def filterBounds(self, geometry: FakeGeometry) -> "FakeCollection":
+        return self
+
+    def filter(self, condition) -> "FakeCollection":
+        return self
+
+    def size(self) -> SimpleNamespace:
+        return SimpleNamespace(getInfo=lambda: 1)
+
+    def median(self) -> FakeImage:
+        return FakeImage(self.thumb_url, self.year)
+
+
+def fake_ee(thumb_url: str) -> SimpleNamespace:
+    # Just enough of the ee module for the per-year download path, with thumbnails served by this server.
+    return SimpleNamespace(
+        Geometry=SimpleNamespace(Polygon=FakeGeometry),
+        ImageCollection=lambda collection_id: FakeCollection(thumb_url),
+        Filter=SimpleNamespace(lt=lambda name, value: (name, value)),
+    )
+
+
+def start_server(
+    port: int = 0,
+    max_concurrent: int = MAX_CONCURRENT,
+    rate: float = RATE_PER_SEC,
+    latency: float = LATENCY_SEC
+) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeEEHandler)
+    server.daemon_threads = True
+    server.state = QuotaState(max_concurrent, rate, latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_demo(requests_total: int, threads: int, max_concurrent: int, rate: float) -> bool:
+    from urllib.request import urlopen
+
+    server = start_server(max_concurrent=max_concurrent, rate=rate)
+    base = f"http://127.0.0.1:{server.server_address[1]}/thumb"
+    limiter = AdaptiveLimiter(max_concurrency=threads, rate=rate, burst=max_concurrent, base_backoff=0.1, max_backoff=2.0)
+
+    def fetch(i: int) -> int:
+        def get():
+            with urlopen(f"{base}?w=32&h=32&seed={i}", timeout=10) as response:
+                return response.read()
+        return len(limiter.call(get))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        sizes = list(pool.map(fetch, range(requests_total)))
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    print(f"Completed {len(sizes)}/{requests_total} requests in {elapsed:.2f} s ({len(sizes) / elapsed:.1f} req/s)")
+    print(f"Server quota: {max_concurrent} concurrent, {rate:.0f} req/s; server stats: {server.state.stats}")
+    print(f"Limiter stats: {limiter.stats}, settled concurrency limit: {limiter.limit:.1f}")
+    return len(sizes) == requests_total and limiter.stats["failed"] == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for Earth Engine thumbnails that injects 429s.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT)
+    parser.add_argument("--rate", type=float, default=RATE_PER_SEC)
+    parser.add_argument("--demo", action="store_true", help="Drive the limiter against the server and report throughput")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    if args.demo:
+        sys.exit(0 if run_demo(args.requests, args.threads, args.max_concurrent, args.rate) else 1)
+
+    server = start_server(args.port, args.max_concurrent, args.rate)
+    print(f"Fake Earth Engine server on http://127.0.0.1:{args.port}/thumb?w=64&h=64 (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from PIL import ImageFont
+
+
+@lru_cache(maxsize=None)
+def find_font(family: str, filename: str) -> str | None:
+    from PIL import ImageFont
+
+    # Pillow searches the system font folders by file name, which avoids importing matplotlib.
+    try:
+        ImageFont.truetype(filename, 10)
+        return filename
+    except OSError:
+        pass
+    try:
+        from matplotlib import font_manager
+        return font_manager.findfont(font_manager.FontProperties(family=family))
+    except Exception as e:
+        print(f"Warning: {family} not found, using default font: {e}")
+        return None
+
+
+@lru_cache(maxsize=64)
+def load_font(family: str, filename: str, size: int) -> ImageFont.FreeTypeFont:
+    from PIL import ImageFont
+
+    font_path = find_font(family, filename)
+    if font_path is None:
+        return ImageFont.load_default(size)
+    return ImageFont.truetype(font_path, size)
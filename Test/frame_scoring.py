@@ -0,0 +1,110 @@
+import re
+import cv2
+import numpy as np
+from pathlib import Path
+from PIL import Image
+
+from frame_stack import is_stack_source, load_source, merge_sources, source_year, stack_sources
+from pyramid import has_pyramid, load_frame
+
+
+PREVIEW_SIZE = (256, 256)
+PREVIEW_DIR = ".previews"
+
+NODATA_DARK = 0.03
+NODATA_BRIGHT = 0.97
+
+SCORE_WEIGHTS = {
+    "contrast": 1.0,
+    "saturation": 1.0,
+    "sharpness": 1.0,
+    "nodata": -3.0,
+}
+
+
+def find_year_frames(folder: Path, place_name: str) -> dict[int, Path | tuple[str, int]]:
+    pattern = re.compile(rf"{re.escape(place_name)}_(\d{{4}})")
+    loose = [p for p in folder.iterdir() if pattern.fullmatch(p.stem) and p.suffix.lower() == ".png"]
+    return {source_year(s): s for s in merge_sources(stack_sources(folder, place_name), loose)}
+
+
+def load_preview(path: Path | tuple[str, int]) -> np.ndarray:
+    if is_stack_source(path):
+        frame = cv2.resize(load_source(path), PREVIEW_SIZE, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    if has_pyramid(path):
+        frame = load_frame(path, PREVIEW_SIZE)
+        if frame is not None:
+            frame = cv2.resize(frame, PREVIEW_SIZE, interpolation=cv2.INTER_AREA)
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    cache_file = path.parent / PREVIEW_DIR / f"{path.stem}.npy"
+    if cache_file.exists() and cache_file.stat().st_mtime >= path.stat().st_mtime:
+        return np.load(cache_file, mmap_mode="r")
+
+    with Image.open(path) as img:
+        img.draft("RGB", PREVIEW_SIZE)
+        preview = np.asarray(img.convert("RGB").resize(PREVIEW_SIZE, Image.BILINEAR, reducing_gap=2.0))
+
+    cache_file.parent.mkdir(exist_ok=True)
+    np.save(cache_file, preview)
+    return preview
+
+
+def frame_metrics(stack: np.ndarray) -> dict[str, np.ndarray]:
+    rgb = stack.astype(np.float32) / 255.0
+    mx = rgb.max(axis=-1)
+    mn = rgb.min(axis=-1)
+    lum = rgb @ np.array([0.299, 0.587, 0.114], np.float32)
+
+    invalid = (mx < NODATA_DARK) | (mn > NODATA_BRIGHT)
+    valid = (~invalid).astype(np.float32)
+    n_valid = np.maximum(valid.sum(axis=(1, 2)), 1.0)
+
+    lum_mean = (lum * valid).sum(axis=(1, 2)) / n_valid
+    lum_var = (((lum - lum_mean[:, None, None]) ** 2) * valid).sum(axis=(1, 2)) / n_valid
+
+    sat = (mx - mn) / np.maximum(mx, 1e-6)
+    saturation = (sat * valid).sum(axis=(1, 2)) / n_valid
+
+    lap = (
+        4 * lum[:, 1:-1, 1:-1]
+        - lum[:, :-2, 1:-1] - lum[:, 2:, 1:-1]
+        - lum[:, 1:-1, :-2] - lum[:, 1:-1, 2:]
+    )
+    lap_valid = (
+        valid[:, 1:-1, 1:-1] * valid[:, :-2, 1:-1] * valid[:, 2:, 1:-1]
+        * valid[:, 1:-1, :-2] * valid[:, 1:-1, 2:]
+    )
+    n_lap = np.maximum(lap_valid.sum(axis=(1, 2)), 1.0)
+    lap_mean = (lap * lap_valid).sum(axis=(1, 2)) / n_lap
+    sharpness = (((lap - lap_mean[:, None, None]) ** 2) * lap_valid).sum(axis=(1, 2)) / n_lap
+
+    return {
+        "contrast": np.sqrt(lum_var),
+        "saturation": saturation,
+        "sharpness": sharpness,
+        "nodata": invalid.mean(axis=(1, 2)),
+    }
+
+
+def score_frames(paths: list[Path]) -> np.ndarray:
+    stack = np.stack([load_preview(p) for p in paths])
+    metrics = frame_metrics(stack)
+
+    scores = np.zeros(len(paths), np.float32)
+    for name, weight in SCORE_WEIGHTS.items():
+        values = metrics[name]
+        if name != "nodata":
+            values = values / max(float(values.max()), 1e-6)
+        scores += weight * values
+    return scores
+
+
+def pick_best_year(folder: Path, place_name: str) -> int | None:
+    frames = find_year_frames(folder, place_name)
+    if not frames:
+        return None
+    years = list(frames)
+    scores = score_frames(list(frames.values()))
+    return years[int(np.argmax(scores))]
@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from pyramid import frame_size, load_frame
+
+STACK_SUFFIX = ".frames"
+MAGIC = b"SATFRAMES1\n"
+# Fixed-size header so frames start at a known offset and the index can be rewritten in place.
+HEADER_BYTES = 65536
+
+_write_lock = threading.Lock()
+_open_cache: dict[str, tuple[int, "FrameStack"]] = {}
+
+Source = Path | str | tuple[str, int]
+
+
+def stack_path(folder: Path, place_name: str) -> Path:
+    return Path(folder) / f"{place_name}{STACK_SUFFIX}"
+
+
+def read_header(path: Path) -> dict:
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_BYTES)
+    if not raw.startswith(MAGIC):
+        raise ValueError(f"Not a frame stack: {path}")
+    return json.loads(raw[len(MAGIC):].rstrip(b"\0 "))
+
+
+def write_header(f, header: dict) -> None:
+    payload = MAGIC + json.dumps(header).encode("utf-8")
+    if len(payload) > HEADER_BYTES:
+        raise ValueError("Frame stack index is full")
+    f.seek(0)
+    f.write(payload.ljust(HEADER_BYTES, b"\0"))
+
+
+class FrameStack:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        header = read_header(self.path)
+        self.width = header["width"]
+        self.height = header["height"]
+        self.slots = header["years"]
+        self.meta = header.get("meta", {})
+        self.data = np.memmap(
+            self.path, np.uint8, "r", offset=HEADER_BYTES, shape=(len(self.slots), self.height, self.width, 3)
+        ) if self.slots else np.empty((0, self.height, self.width, 3), np.uint8)
+
+    @property
+    def years(self) -> list[int]:
+        return sorted(self.slots)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.width, self.height
+
+    def frame(self, year: int) -> np.ndarray:
+        # A view into the memory map; nothing is decoded or copied.
+        return self.data[self.slots.index(year)]
+
+
+def open_stack(path: Path | str) -> FrameStack:
+    path = str(path)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _open_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _open_cache[path] = (mtime, FrameStack(Path(path)))
+    return cached[1]
+
+
+def readable_stack(path: Path | str) -> FrameStack | None:
+    if not os.path.exists(path):
+        return None
+    try:
+        return open_stack(path)
+    except ValueError as e:
+        # A crash before the first index write leaves pixels with no header; such a file has no frames.
+        print(f"Warning: ignoring unreadable frame stack {path}: {e}")
+        return None
+
+
+@contextmanager
+def _file_lock(path: Path):
+    # Serializes appends across processes; _write_lock only covers threads of this one.
+    with open(f"{path}.lock", "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            # msvcrt locks bytes from the current position, and "a+b" opens at the end.
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def append_frame(path: Path, year: int, frame: np.ndarray, meta: dict | None = None) -> Path:
+    path = Path(path)
+    frame = frame[..., :3]
+    with _write_lock, _file_lock(path):
+        try:
+            header = read_header(path)
+        except (FileNotFoundError, ValueError):
+            # No stack yet, or one whose first header write never happened: start it over.
+            h, w = frame.shape[:2]
+            header = {"width": w, "height": h, "years": [], "meta": {}}
+        size = (header["width"], header["height"])
+        if (frame.shape[1], frame.shape[0]) != size:
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        years = header["years"]
+        slot = years.index(year) if year in years else len(years)
+        with open(path, "r+b" if header["years"] else "w+b") as f:
+            # Write the pixels before the index so a crash never indexes a half-written frame.
+            f.seek(HEADER_BYTES + slot * frame.nbytes)
+            f.write(np.ascontiguousarray(frame, np.uint8).tobytes())
+            if slot == len(years):
+                years.append(year)
+            header["meta"][str(year)] = meta or {}
+            write_header(f, header)
+    return path
+
+
+def stack_sources(folder: Path, place_name: str) -> list[tuple[str, int]]:
+    path = stack_path(folder, place_name)
+    stack = readable_stack(path)
+    if stack is None:
+        return []
+    return [(str(path), year) for year in stack.years]
+
+
+def merge_sources(packed: list[tuple[str, int]], loose: list[Path]) -> list[Source]:
+    # Stack frames win; loose images add the years downloaded after the stack was packed.
+    by_year: dict[int, Source] = {source_year(p): p for p in loose}
+    by_year.update((source_year(s), s) for s in packed)
+    return [by_year[year] for year in sorted(by_year)]
+
+
+def is_stack_source(source: Source) -> bool:
+    return isinstance(source, tuple)
+
+
+def load_source(source: Source, min_size: tuple[int, int] | None = None) -> np.ndarray | None:
+    if is_stack_source(source):
+        path, year = source
+        return open_stack(path).frame(year)
+    return load_frame(Path(source), min_size)
+
+
+def source_size(source: Source) -> tuple[int, int] | None:
+    if is_stack_source(source):
+        return open_stack(source[0]).size
+    return frame_size(Path(source))
+
+
+def source_year(source: Source) -> int:
+    return source[1] if is_stack_source(source) else int(Path(source).stem[-4:])
+
+
+def source_name(source: Source) -> str:
+    return f"{Path(source[0]).name}:{source[1]}" if is_stack_source(source) else Path(source).name
+
+
+def find_source(folder: Path, place_name: str, year: int) -> Source:
+    path = stack_path(folder, place_name)
+    stack = readable_stack(path)
+    if stack is not None and year in stack.slots:
+        return str(path), year
+    return Path(folder) / f"{place_name}_{year}.png"
+
+
+def pack(folder: Path, place_name: str) -> Path:
+    from Satellite_video import year_frames
+
+    path = stack_path(folder, place_name)
+    for p in year_frames(Path(folder), place_name):
+        frame = cv2.imread(str(p))
+        if frame is not None:
+            append_frame(path, source_year(p), frame, {"source": p.name})
+    return path
+
+
+def export_png(folder: Path, place_name: str, out_dir: Path | None = None) -> list[Path]:
+    stack = open_stack(stack_path(folder, place_name))
+    out_dir = Path(out_dir or folder)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    saved = []
+    for year in stack.years:
+        out = out_dir / f"{place_name}_{year}.png"
+        cv2.imwrite(str(out), stack.frame(year))
+        saved.append(out)
+    return saved
+
+
+if __name__ == "__main__":
+    from utils import DEFAULT_OUTPUT_DIR
+
+    parser = argparse.ArgumentParser(description="Pack yearly frames into one memory-mappable file, or export them as PNG.")
+    parser.add_argument("command", choices=("info", "pack", "export"))
+    parser.add_argument("place")
+    parser.add_argument("--out", help="Folder for exported PNGs (default: the place folder)")
+    args = parser.parse_args()
+
+    folder = Path(DEFAULT_OUTPUT_DIR, args.place)
+    if args.command == "pack":
+        print(f"Packed: {pack(folder, args.place)}")
+    elif args.command == "export":
+        print(f"Exported {len(export_png(folder, args.place, args.out))} frames")
+    stack = open_stack(stack_path(folder, args.place))
+    print(f"{stack.path}: {len(stack.slots)} frames at {stack.width}x{stack.height}, years {stack.years}")
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Cumulative import time allowed per entry module, in milliseconds.
+IMPORT_BUDGET_MS = {
+    "utils": 60,
+    "jobs": 40,
+    "fonts": 30,
+    "main": 80,
+    "Satellite_image": 80,
+    "Satellite_video": 80,
+    "Video_thumbnail": 80,
+    "Weather_image": 80,
+    "Weather_video": 80,
+}
+HEAVY_MODULES = ("ee", "cv2", "numpy", "matplotlib", "PIL", "requests")
+# Each module is imported this many times in fresh interpreters and the fastest run is kept,
+# so one cold disk cache or busy moment does not fail the check.
+SAMPLES = 5
+
+
+def measure_import(module: str) -> tuple[float, list[str]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+
+    cumulative_us = 0
+    imported = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        if not parts[1].isdigit():
+            continue
+        name = parts[2]
+        imported.append(name)
+        if name == module:
+            cumulative_us = int(parts[1])
+    return cumulative_us / 1000, imported
+
+
+def best_import(module: str, samples: int = SAMPLES) -> tuple[float, list[str]]:
+    runs = [measure_import(module) for _ in range(samples)]
+    return min(elapsed for elapsed, _ in runs), sorted({name for _, imported in runs for name in imported})
+
+
+def check_budget(samples: int = SAMPLES) -> bool:
+    ok = True
+    print(f"{'module':<18}{'ms':>8}{'budget':>8}  heavy imports")
+    for module, budget_ms in IMPORT_BUDGET_MS.items():
+        elapsed_ms, imported = best_import(module, samples)
+        heavy = sorted({name for name in imported if name in HEAVY_MODULES})
+        over = elapsed_ms > budget_ms or heavy
+        ok = ok and not over
+        flag = "  OVER" if over else ""
+        print(f"{module:<18}{elapsed_ms:>8.1f}{budget_ms:>8}  {', '.join(heavy) or '-'}{flag}")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_budget() else 1)
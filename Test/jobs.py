@@ -0,0 +1,119 @@
+import itertools
+import queue
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    job_id: int
+    name: str
+    func: Callable[..., Any]
+    args: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+    status: str = "queued"
+    progress: float = 0.0
+    message: str = ""
+    submitted: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    result: Any = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+
+
+_local = threading.local()
+
+
+def current_job() -> Job | None:
+    return getattr(_local, "job", None)
+
+
+def report_progress(done: int, total: int, message: str = "") -> None:
+    job = current_job()
+    if job is None:
+        return
+    job.progress = done / total if total else 0.0
+    job.message = message
+    _local.runner._emit(job)
+
+
+def check_cancelled() -> None:
+    job = current_job()
+    if job is not None and job.cancel_event.is_set():
+        raise JobCancelled(f"Job {job.job_id} cancelled")
+
+
+class JobRunner:
+    def __init__(self, workers: int = 2):
+        self.jobs: dict[int, Job] = {}
+        self.events: queue.Queue = queue.Queue()
+        self._queue: queue.Queue = queue.Queue()
+        self._ids = itertools.count(1)
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, name: str, func: Callable[..., Any], *args, **kwargs) -> Job:
+        job = Job(next(self._ids), name, func, args, kwargs)
+        self.jobs[job.job_id] = job
+        self._queue.put(job)
+        self._emit(job)
+        return job
+
+    def cancel(self, job_id: int) -> None:
+        job = self.jobs.get(job_id)
+        if job is None or job.status not in ("queued", "running"):
+            return
+        job.cancel_event.set()
+        if job.status == "queued":
+            job.message = "cancelling"
+            self._emit(job)
+
+    def shutdown(self) -> None:
+        for job in self.jobs.values():
+            job.cancel_event.set()
+        for _ in self._threads:
+            self._queue.put(None)
+
+    def _emit(self, job: Job) -> None:
+        self.events.put((job.job_id, job.name, job.status, job.progress, job.message))
+
+    def _worker(self) -> None:
+        _local.runner = self
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if job.cancel_event.is_set():
+                job.status = "cancelled"
+                self._emit(job)
+                continue
+
+            job.status = "running"
+            job.started = time.time()
+            self._emit(job)
+            _local.job = job
+            try:
+                job.result = job.func(*job.args, **job.kwargs)
+                job.status = "done"
+                job.progress = 1.0
+            except JobCancelled:
+                job.status = "cancelled"
+            except Exception as e:
+                job.status = "failed"
+                job.message = str(e)
+                traceback.print_exc()
+            finally:
+                _local.job = None
+                job.finished = time.time()
+                self._emit(job)
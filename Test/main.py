@@ -1,37 +1,117 @@
 import tkinter as tk
-import subprocess
+import importlib
+import queue
 import sys
 import os
-import sys as _sys
 
-def run_script(script_name: str) -> None:
-    if not script_name:
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from jobs import JobRunner
+from utils import (
+    DialogCancelled,
+    get_satellite_image_inputs,
+    get_thumbnail_inputs,
+    get_video_inputs,
+    get_weather_inputs,
+)
+
+WORKERS = 2
+POLL_MS = 100
+
+# (label, dialog, module, function, supports draft mode)
+TOOLS = [
+    ("Get Satellite Images", get_satellite_image_inputs, "Satellite_image", "download_satellite_images", True),
+    ("Create Satellite Video", get_video_inputs, "Satellite_video", "create_video", True),
+    ("Create Thumbnail", get_thumbnail_inputs, "Video_thumbnail", "create_thumbnail", False),
+    ("Get Weather Image", get_weather_inputs, "Weather_image", "get_weather_image", True),
+    ("Create Weather Video", get_weather_inputs, "Weather_video", "create_weather_timelapse", True),
+    ("Weather Image + Video", get_weather_inputs, "Weather_video", "create_weather_products", True),
+]
+
+
+def run_tool(module_name: str, func_name: str, *args, **kwargs):
+    # Tool modules are imported once per launcher process and stay warm for later jobs.
+    module = importlib.import_module(module_name)
+    return getattr(module, func_name)(*args, **kwargs)
+
+
+def launch_tool(
+    root: tk.Tk,
+    runner: JobRunner,
+    label: str,
+    get_inputs,
+    module_name: str,
+    func_name: str,
+    draft: bool = False
+) -> None:
+    try:
+        inputs = get_inputs(master=root)
+    except DialogCancelled:
         return
-    script_path = os.path.join(os.path.dirname(__file__), script_name)
-    subprocess.Popen([sys.executable, script_path])
+    if draft:
+        runner.submit(f"{label} (draft)", run_tool, module_name, func_name, *inputs, draft=True)
+    else:
+        runner.submit(label, run_tool, module_name, func_name, *inputs)
+
+
+def format_job(name: str, status: str, progress: float, message: str) -> str:
+    text = f"{name}: {status}"
+    if status == "running":
+        text += f" {progress * 100:.0f}%"
+    if message:
+        text += f" - {message}"
+    return text
+
 
 if __name__ == "__main__":
     root = tk.Tk()
     root.title("Satellite Weather Tools")
-    root.geometry("270x440")
+    root.geometry("320x740")
+
+    runner = JobRunner(workers=WORKERS)
 
-    buttons = [
-        ("Get Satellite Images", "Satellite_image.py", True),
-        ("Create Satellite Video", "Satellite_video.py", True),
-        ("Create Thumbnail", "Video_thumbnail.py", True),
-        ("Get Weather Image", "Weather_image.py", True),
-        ("Create Weather Video", "Weather_video.py", True),
-    ]
+    draft_var = tk.BooleanVar(master=root, value=False)
 
-    for label, script, enabled in buttons:
+    for label, get_inputs, module_name, func_name, supports_draft in TOOLS:
         btn = tk.Button(
             root,
             text=label,
             width=20,
             height=2,
-            command=lambda s=script: run_script(s),
-            state="normal" if enabled else "disabled"
+            command=lambda l=label, g=get_inputs, m=module_name, f=func_name, d=supports_draft: launch_tool(
+                root, runner, l, g, m, f, d and draft_var.get()
+            )
         )
         btn.pack(pady=6)
 
+    tk.Checkbutton(root, text="Draft preview (fast, low resolution)", variable=draft_var).pack(pady=2)
+
+    tk.Label(root, text="Jobs:").pack(anchor="w", padx=8)
+    job_list = tk.Listbox(root, width=48, height=10)
+    job_list.pack(padx=8, fill="both", expand=True)
+    job_rows: list[int] = []
+
+    def cancel_selected():
+        for i in job_list.curselection():
+            runner.cancel(job_rows[i])
+
+    tk.Button(root, text="Cancel selected", command=cancel_selected).pack(pady=6)
+
+    def poll_events():
+        while True:
+            try:
+                job_id, name, status, progress, message = runner.events.get_nowait()
+            except queue.Empty:
+                break
+            text = format_job(f"#{job_id} {name}", status, progress, message)
+            if job_id in job_rows:
+                row = job_rows.index(job_id)
+                job_list.delete(row)
+                job_list.insert(row, text)
+            else:
+                job_rows.append(job_id)
+                job_list.insert("end", text)
+        root.after(POLL_MS, poll_events)
+
+    root.after(POLL_MS, poll_events)
     root.mainloop()
+    runner.shutdown()
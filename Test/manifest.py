@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+MANIFEST_FILE = ".manifest.sqlite"
+# A running unit not finished within this many seconds is assumed abandoned.
+LEASE_SEC = 180
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    job TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    status TEXT NOT NULL,
+    input_hash TEXT,
+    output_path TEXT,
+    worker TEXT,
+    started_at REAL,
+    finished_at REAL,
+    duration REAL,
+    error TEXT,
+    PRIMARY KEY (job, unit)
+)
+"""
+
+
+def input_hash(*parts) -> str:
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class JobManifest:
+    def __init__(self, output_dir: str, job: str, worker: str | None = None, max_age: float | None = None):
+        self.path = Path(output_dir) / MANIFEST_FILE
+        self.job = job
+        # Units finished longer ago than this count as not done, so they are checked again.
+        self.max_age = max_age
+        self.worker = worker or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        with closing(self._connect()) as conn:
+            conn.execute(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _row(self, conn: sqlite3.Connection, unit: str) -> tuple | None:
+        return conn.execute(
+            "SELECT status, input_hash, output_path, worker, started_at, finished_at FROM units WHERE job = ? AND unit = ?",
+            (self.job, unit),
+        ).fetchone()
+
+    def _is_complete(self, row: tuple | None, unit_hash: str) -> bool:
+        if row is None or row[0] != "done" or row[1] != unit_hash:
+            return False
+        if self.max_age is not None and time.time() - (row[5] or 0) > self.max_age:
+            return False
+        return row[2] is None or os.path.exists(row[2])
+
+    def is_done(self, unit: str, unit_hash: str) -> bool:
+        with closing(self._connect()) as conn:
+            return self._is_complete(self._row(conn, unit), unit_hash)
+
+    def claim(self, unit: str, unit_hash: str) -> bool:
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock so only one worker can claim a unit.
+            conn.execute("BEGIN IMMEDIATE")
+            row = self._row(conn, unit)
+            if self._is_complete(row, unit_hash):
+                conn.execute("ROLLBACK")
+                return False
+            now = time.time()
+            if row is not None and row[0] == "running" and row[3] != self.worker and now - (row[4] or 0) < LEASE_SEC:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO units (job, unit, status, input_hash, output_path, worker, started_at) "
+                "VALUES (?, ?, 'running', ?, NULL, ?, ?)",
+                (self.job, unit, unit_hash, self.worker, now),
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _finish(self, unit: str, status: str, output_path: str | None, error: str | None) -> None:
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE units SET status = ?, output_path = ?, error = ?, finished_at = ?, duration = ? - started_at "
+                "WHERE job = ? AND unit = ?",
+                (status, output_path, error, now, now, self.job, unit),
+            )
+
+    def complete(self, unit: str, output_path: str | None = None) -> None:
+        self._finish(unit, "done", output_path, None)
+
+    def fail(self, unit: str, error: str) -> None:
+        self._finish(unit, "failed", None, error)
+
+    def skip(self, unit: str, reason: str) -> None:
+        # Released without output; the next run claims the unit again.
+        self._finish(unit, "skipped", None, reason)
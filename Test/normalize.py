@@ -0,0 +1,111 @@
+import argparse
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from frame_stack import load_source, source_year
+from tracing import span
+
+METHODS = ("gain", "histogram")
+FIT_SIZE = (512, 512)
+LOW_PCT, HIGH_PCT = 0.02, 0.98
+LEVELS = 256
+# Frames per vectorized chunk, which bounds the index temporaries on large stacks.
+CHUNK = 8
+
+
+def preview_stack(files: list, size: tuple[int, int] = FIT_SIZE, folder: str | None = None) -> np.memmap:
+    w, h = size
+    path = os.path.join(folder or tempfile.mkdtemp(prefix="normalize_"), "stack.npy")
+    stack = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(len(files), h, w, 3))
+    for i, f in enumerate(files):
+        # The small pyramid levels are enough to fit per-channel statistics.
+        frame = load_source(f, size)
+        if frame is None:
+            raise ValueError(f"Could not read image: {f}")
+        stack[i] = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+    return stack
+
+
+def histograms(stack: np.ndarray) -> np.ndarray:
+    n = stack.shape[0]
+    counts = np.zeros(n * 3 * LEVELS + 1, np.int64)
+    dump = n * 3 * LEVELS
+    for start in range(0, n, CHUNK):
+        pixels = stack[start:start + CHUNK].reshape(-1, stack[0].size // 3, 3)
+        frames = np.arange(start, start + len(pixels), dtype=np.int32)
+        bins = pixels + np.arange(3, dtype=np.int32) * LEVELS + (frames * 3 * LEVELS)[:, None, None]
+        # Black pixels are Landsat no-data edges and are left out of the fit.
+        bins[~pixels.any(axis=2)] = dump
+        counts += np.bincount(bins.ravel(), minlength=dump + 1)
+    return counts[:dump].reshape(n, 3, LEVELS)
+
+
+def cdfs(hist: np.ndarray) -> np.ndarray:
+    cdf = np.cumsum(hist, axis=-1)
+    return cdf / np.maximum(cdf[..., -1:], 1)
+
+
+def percentile(cdf: np.ndarray, q: float) -> np.ndarray:
+    return (cdf < q).sum(axis=-1).astype(np.float64)
+
+
+def fit_gain_luts(cdf: np.ndarray, ref_cdf: np.ndarray) -> np.ndarray:
+    lo, hi = percentile(cdf, LOW_PCT), percentile(cdf, HIGH_PCT)
+    ref_lo, ref_hi = percentile(ref_cdf, LOW_PCT), percentile(ref_cdf, HIGH_PCT)
+    gain = (ref_hi - ref_lo) / np.maximum(hi - lo, 1)
+    offset = ref_lo - gain * lo
+    return np.clip(np.round(gain[..., None] * np.arange(LEVELS) + offset[..., None]), 0, 255)
+
+
+def fit_histogram_luts(cdf: np.ndarray, ref_cdf: np.ndarray) -> np.ndarray:
+    # For each level, the first reference level whose CDF reaches this frame's CDF.
+    return (cdf[..., :, None] > ref_cdf[..., None, :]).sum(axis=-1).clip(0, LEVELS - 1)
+
+
+def fit_luts(stack: np.ndarray, method: str = "gain", reference: int | None = None) -> np.ndarray:
+    if method not in METHODS:
+        raise ValueError(f"Unknown normalization method: {method}")
+    with span("normalize_fit", frames=len(stack), method=method):
+        cdf = cdfs(histograms(stack))
+        # Without a reference year, match every frame to the median distribution over all years.
+        ref_cdf = np.median(cdf, axis=0) if reference is None else cdf[reference]
+        fit = fit_gain_luts if method == "gain" else fit_histogram_luts
+        luts = fit(cdf, ref_cdf).astype(np.uint8)
+        luts[..., 0] = 0
+    return luts
+
+
+def apply_lut(frame: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    return cv2.LUT(frame, lut.T.reshape(1, LEVELS, 3).copy())
+
+
+def fit_frames(files: list, method: str = "gain", reference: int | None = None) -> dict:
+    with tempfile.TemporaryDirectory(prefix="normalize_") as folder:
+        stack = preview_stack(files, folder=folder)
+        luts = fit_luts(stack, method, reference)
+        del stack
+    return dict(zip(files, luts))
+
+
+if __name__ == "__main__":
+    from Satellite_video import year_sources
+    from utils import DEFAULT_OUTPUT_DIR
+
+    parser = argparse.ArgumentParser(description="Fit per-year tone curves that remove flicker between Landsat sensors.")
+    parser.add_argument("place")
+    parser.add_argument("--method", choices=METHODS, default="gain")
+    parser.add_argument("--reference", type=int, help="Year to match (default: the median of all years)")
+    args = parser.parse_args()
+
+    files = [p if isinstance(p, tuple) else str(p) for p in year_sources(Path(DEFAULT_OUTPUT_DIR, args.place), args.place)]
+    years = [source_year(f) for f in files]
+    reference = years.index(args.reference) if args.reference else None
+    for year, (f, lut) in zip(years, fit_frames(files, args.method, reference).items()):
+        mid = lut[:, LEVELS // 2]
+        print(f"{year}: level 128 -> B {mid[0]}, G {mid[1]}, R {mid[2]}")
@@ -0,0 +1,279 @@
+import argparse
+import glob
+import json
+import math
+import os
+import statistics
+import sys
+from dataclasses import asdict, dataclass, field
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from utils import DEFAULT_OUTPUT_DIR
+from draft import FINAL
+from tracing import TRACE_DIR
+from transfer import EE_MAX_REQUEST_BYTES, LANDSAT_SCALE_M, filmstrip_frames_per_request, request_dimensions
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CALLS_PER_YEAR = 3
+
+
+@dataclass
+class Calibration:
+    server_sec_per_call: float = 1.5
+    download_bytes_per_pixel: float = 2.0
+    download_bytes_per_sec: float = 5e6
+    save_sec_per_frame: float = 1.2
+    frame_disk_bytes: float = 3.5e6
+    video_sec_per_frame: float = 0.004
+    video_bytes_per_frame: float = 40e3
+    thumbnail_bytes_per_pixel: float = 1.5
+    sources: list[str] = field(default_factory=list)
+
+
+@dataclass
+class JobPlan:
+    years: int
+    width: int
+    height: int
+    ee_calls: int
+    downloads: int
+    megapixels: float
+    max_request_bytes: int
+    download_bytes: int
+    disk_bytes: int
+    video_frames: int
+    seconds: dict[str, float]
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.seconds.values())
+
+    @property
+    def requests(self) -> int:
+        return self.ee_calls + self.downloads
+
+
+def request_size(bbox: tuple[float, float, float, float], dimensions: int = FINAL.image_dimensions) -> tuple[int, int]:
+    lat_top, lat_bottom, lon_left, lon_right = bbox
+    lat_span = abs(lat_top - lat_bottom)
+    lon_span = abs(lon_right - lon_left)
+    if lon_span >= lat_span:
+        return dimensions, max(1, round(dimensions * lat_span / lon_span))
+    return max(1, round(dimensions * lon_span / lat_span)), dimensions
+
+
+def read_spans(trace_dirs: list[str]) -> list[dict]:
+    spans = []
+    for trace_dir in trace_dirs:
+        for path in glob.glob(os.path.join(trace_dir, "*.jsonl")):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        spans.append(json.loads(line) | {"trace": path})
+    return spans
+
+
+def default_trace_dirs() -> list[str]:
+    return glob.glob(os.path.join(DEFAULT_OUTPUT_DIR, "*", TRACE_DIR))
+
+
+def latest_bench_file() -> str | None:
+    files = sorted(glob.glob(os.path.join(HERE, "bench_results", "bench_*.json")))
+    return files[-1] if files else None
+
+
+def calibrate(trace_dirs: list[str] | None = None, bench_file: str | None = None) -> Calibration:
+    cal = Calibration()
+    spans = read_spans(default_trace_dirs() if trace_dirs is None else trace_dirs)
+
+    def of(job: str, *names: str) -> list[dict]:
+        return [s for s in spans if s["job"] == job and s["name"] in names]
+
+    calls = of("satellite_images", "server_compute", "thumb_url")
+    if calls:
+        cal.server_sec_per_call = statistics.median(s["duration"] for s in calls)
+    downloads = [s for s in of("satellite_images", "http_download") if "bytes" in s["attrs"]]
+    pixels = sum(s["attrs"].get("pixels", 0) for s in of("satellite_images", "decode"))
+    if downloads:
+        total_bytes = sum(s["attrs"]["bytes"] for s in downloads)
+        total_time = sum(s["duration"] for s in downloads)
+        if total_time > 0:
+            cal.download_bytes_per_sec = total_bytes / total_time
+        if pixels:
+            cal.download_bytes_per_pixel = total_bytes / pixels
+    writes = [s for s in of("satellite_images", "disk_write") if "bytes" in s["attrs"]]
+    if writes:
+        cal.frame_disk_bytes = statistics.median(s["attrs"]["bytes"] for s in writes)
+        saves = of("satellite_images", "annotate", "disk_write", "pyramid")
+        cal.save_sec_per_frame = sum(s["duration"] for s in saves) / len(writes)
+    encodes = [s for s in of("create_video", "encode") if s["attrs"].get("frames")]
+    if encodes:
+        frames = sum(s["attrs"]["frames"] for s in encodes)
+        cal.video_sec_per_frame = sum(s["duration"] for s in of("create_video", "encode", "decode", "overlay")) / frames
+    videos = [s for s in of("create_video", "video_file") if s["attrs"].get("frames")]
+    if videos:
+        cal.video_bytes_per_frame = sum(s["attrs"]["bytes"] for s in videos) / sum(s["attrs"]["frames"] for s in videos)
+    if spans:
+        cal.sources.append(f"{len(spans)} trace spans")
+
+    bench_file = bench_file or (latest_bench_file() if not encodes else None)
+    if bench_file and os.path.exists(bench_file):
+        with open(bench_file, "r", encoding="utf-8") as f:
+            results = json.load(f)["results"]
+        per_frame = [
+            1 / r["fps"] for r in results
+            if r["stage"] == "create_video" and r["fps"]
+        ]
+        if per_frame:
+            cal.video_sec_per_frame = statistics.median(per_frame)
+            cal.sources.append(os.path.basename(bench_file))
+    return cal
+
+
+def plan_satellite_job(
+    bbox: tuple[float, float, float, float],
+    start_year: int,
+    stop_year: int,
+    dimensions: int | None = None,
+    profiles: list[str] | None = None,
+    video: bool = True,
+    single_request: bool = False,
+    calibration: Calibration | None = None,
+    with_statistics: bool = False
+) -> JobPlan:
+    # The tool modules are only needed for two helpers, so they load on first plan, not on import.
+    from Satellite_video import video_frame_count
+    from Video_thumbnail import THUMBNAIL_PROFILES
+
+    cal = calibration or Calibration()
+    years = stop_year - start_year + 1
+    # Same sizing as Satellite_image.landsat_dimensions for a final download.
+    dimensions = dimensions or request_dimensions(bbox, LANDSAT_SCALE_M, FINAL.image_dimensions)
+    width, height = request_size(bbox, dimensions)
+    pixels = width * height * years
+
+    if single_request:
+        # One call for the scene counts, then one URL per filmstrip chunk.
+        per_request = min(years, filmstrip_frames_per_request(dimensions))
+        downloads = math.ceil(years / per_request)
+        ee_calls = 1 + downloads
+        max_request_bytes = width * height * 3 * per_request
+    else:
+        ee_calls, downloads = CALLS_PER_YEAR * years, years
+        max_request_bytes = width * height * 3
+    if with_statistics:
+        # All years are reduced in one batched call.
+        ee_calls += 1
+    download_bytes = int(pixels * cal.download_bytes_per_pixel)
+
+    disk_bytes = years * cal.frame_disk_bytes
+    video_frames = video_frame_count(years) if video else 0
+    disk_bytes += video_frames * cal.video_bytes_per_frame
+    for profile in profiles or []:
+        w, h = THUMBNAIL_PROFILES[profile]
+        disk_bytes += w * h * cal.thumbnail_bytes_per_pixel
+
+    seconds = {
+        "server": ee_calls * cal.server_sec_per_call,
+        "download": download_bytes / cal.download_bytes_per_sec,
+        "save": years * cal.save_sec_per_frame,
+        "video": video_frames * cal.video_sec_per_frame,
+    }
+    return JobPlan(
+        years=years,
+        width=width,
+        height=height,
+        ee_calls=ee_calls,
+        downloads=downloads,
+        megapixels=pixels / 1e6,
+        max_request_bytes=max_request_bytes,
+        download_bytes=download_bytes,
+        disk_bytes=int(disk_bytes),
+        video_frames=video_frames,
+        seconds=seconds,
+    )
+
+
+def check_limits(
+    plan: JobPlan,
+    max_requests: int | None = None,
+    max_download_mb: float | None = None,
+    max_disk_mb: float | None = None,
+    max_minutes: float | None = None
+) -> list[str]:
+    problems = []
+    if plan.max_request_bytes > EE_MAX_REQUEST_BYTES:
+        problems.append(
+            f"single request of {plan.max_request_bytes / 2**20:.0f} MiB exceeds the Earth Engine "
+            f"limit of {EE_MAX_REQUEST_BYTES / 2**20:.0f} MiB"
+        )
+    if max_requests is not None and plan.requests > max_requests:
+        problems.append(f"{plan.requests} requests > {max_requests}")
+    if max_download_mb is not None and plan.download_bytes / 1e6 > max_download_mb:
+        problems.append(f"{plan.download_bytes / 1e6:.0f} MB download > {max_download_mb:.0f} MB")
+    if max_disk_mb is not None and plan.disk_bytes / 1e6 > max_disk_mb:
+        problems.append(f"{plan.disk_bytes / 1e6:.0f} MB on disk > {max_disk_mb:.0f} MB")
+    if max_minutes is not None and plan.total_seconds / 60 > max_minutes:
+        problems.append(f"{plan.total_seconds / 60:.1f} min > {max_minutes:.1f} min")
+    return problems
+
+
+def format_plan(plan: JobPlan) -> str:
+    lines = [
+        f"Years:          {plan.years} at {plan.width}x{plan.height}",
+        f"Requests:       {plan.requests} ({plan.ee_calls} Earth Engine calls, {plan.downloads} downloads)",
+        f"Pixels:         {plan.megapixels:.1f} MP",
+        f"Download:       {plan.download_bytes / 1e6:.1f} MB (largest request {plan.max_request_bytes / 2**20:.1f} MiB raw)",
+        f"Disk:           {plan.disk_bytes / 1e6:.1f} MB",
+        f"Video frames:   {plan.video_frames}",
+    ]
+    for stage, sec in plan.seconds.items():
+        lines.append(f"Time {stage + ':':<11}{sec:.1f} s")
+    lines.append(f"Time total:     {plan.total_seconds / 60:.1f} min")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from Video_thumbnail import THUMBNAIL_PROFILES
+
+    parser = argparse.ArgumentParser(description="Estimate requests, pixels, bytes and time for a satellite job.")
+    parser.add_argument("--bbox", type=float, nargs=4, required=True, metavar=("LAT_TOP", "LAT_BOTTOM", "LON_LEFT", "LON_RIGHT"))
+    parser.add_argument("--years", type=int, nargs=2, required=True, metavar=("START", "STOP"))
+    parser.add_argument("--dimensions", type=int, help="Long side of each request (default: scale-aware, at most %d)" % FINAL.image_dimensions)
+    parser.add_argument("--profiles", nargs="*", choices=sorted(THUMBNAIL_PROFILES), default=[])
+    parser.add_argument("--no-video", action="store_true")
+    parser.add_argument("--single-request", action="store_true")
+    parser.add_argument("--stats", action="store_true", help="Include the per-year statistics export")
+    parser.add_argument("--traces", nargs="*", help="Trace folders to calibrate from (default: all under the output folder)")
+    parser.add_argument("--bench", help="Benchmark results JSON to calibrate encode speed from")
+    parser.add_argument("--max-requests", type=int)
+    parser.add_argument("--max-download-mb", type=float)
+    parser.add_argument("--max-disk-mb", type=float)
+    parser.add_argument("--max-minutes", type=float)
+    parser.add_argument("--json", action="store_true", help="Print the plan as JSON")
+    args = parser.parse_args()
+
+    cal = calibrate(args.traces, args.bench)
+    plan = plan_satellite_job(
+        tuple(args.bbox), args.years[0], args.years[1],
+        dimensions=args.dimensions,
+        profiles=args.profiles,
+        video=not args.no_video,
+        single_request=args.single_request,
+        calibration=cal,
+        with_statistics=args.stats,
+    )
+    problems = check_limits(plan, args.max_requests, args.max_download_mb, args.max_disk_mb, args.max_minutes)
+
+    if args.json:
+        print(json.dumps({
+            "plan": asdict(plan) | {"requests": plan.requests, "total_seconds": plan.total_seconds},
+            "calibration": asdict(cal),
+            "problems": problems,
+        }, indent=1))
+    else:
+        print(format_plan(plan))
+        print(f"Calibrated from: {', '.join(cal.sources) or 'defaults'}")
+        for problem in problems:
+            print(f"Over limit: {problem}")
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,126 @@
+import cv2
+import json
+import os
+import sys
+import threading
+import numpy as np
+from pathlib import Path
+
+
+PYRAMID_DIR = ".pyramid"
+INDEX_FILE = "index.json"
+MIN_LEVEL_SIZE = 128
+LEVEL_QUALITY = 90
+
+_index_lock = threading.Lock()
+_index_cache: dict[Path, tuple[int, dict]] = {}
+
+
+def _index_path(folder: Path) -> Path:
+    return folder / PYRAMID_DIR / INDEX_FILE
+
+
+def load_index(folder: Path) -> dict:
+    index_file = _index_path(folder)
+    try:
+        mtime = index_file.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    cached = _index_cache.get(index_file)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(index_file, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    _index_cache[index_file] = (mtime, index)
+    return index
+
+
+def _save_index(folder: Path, index: dict) -> None:
+    index_file = _index_path(folder)
+    tmp_file = index_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_file, index_file)
+    _index_cache[index_file] = (index_file.stat().st_mtime_ns, index)
+
+
+def _entry(path: Path) -> dict | None:
+    entry = load_index(path.parent).get(path.name)
+    if entry is None:
+        return None
+    try:
+        if path.stat().st_mtime_ns != entry["mtime"]:
+            return None
+    except FileNotFoundError:
+        return None
+    return entry
+
+
+def build_pyramid(path: Path, image: np.ndarray | None = None) -> list[list]:
+    path = Path(path)
+    if image is None:
+        image = cv2.imread(str(path))
+        if image is None:
+            raise ValueError(f"Could not read image: {path}")
+
+    level_dir = path.parent / PYRAMID_DIR
+    level_dir.mkdir(exist_ok=True)
+
+    h, w = image.shape[:2]
+    levels = []
+    level = image
+    n = 1
+    while min(level.shape[:2]) // 2 >= MIN_LEVEL_SIZE:
+        level = cv2.resize(level, (level.shape[1] // 2, level.shape[0] // 2), interpolation=cv2.INTER_AREA)
+        level_name = f"{path.stem}_L{n}.jpg"
+        cv2.imwrite(str(level_dir / level_name), level, [cv2.IMWRITE_JPEG_QUALITY, LEVEL_QUALITY])
+        levels.append([level.shape[1], level.shape[0], level_name])
+        n += 1
+
+    with _index_lock:
+        index = dict(load_index(path.parent))
+        index[path.name] = {
+            "mtime": path.stat().st_mtime_ns,
+            "size": [w, h],
+            "levels": levels,
+        }
+        _save_index(path.parent, index)
+    return levels
+
+
+def has_pyramid(path: Path) -> bool:
+    return _entry(Path(path)) is not None
+
+
+def frame_size(path: Path) -> tuple[int, int] | None:
+    path = Path(path)
+    entry = _entry(path)
+    if entry is not None:
+        return tuple(entry["size"])
+    from PIL import Image
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def load_frame(path: Path, min_size: tuple[int, int] | None = None) -> np.ndarray | None:
+    path = Path(path)
+    entry = _entry(path) if min_size else None
+    if entry is not None:
+        min_w, min_h = min_size
+        for w, h, level_name in reversed(entry["levels"]):
+            if w >= min_w and h >= min_h:
+                level = cv2.imread(str(path.parent / PYRAMID_DIR / level_name))
+                if level is not None:
+                    return level
+                break
+    return cv2.imread(str(path))
+
+
+if __name__ == "__main__":
+    for folder in sys.argv[1:]:
+        for p in sorted(Path(folder).glob("*.png")):
+            levels = build_pyramid(p)
+            print(f"{p.name}: {len(levels)} levels")
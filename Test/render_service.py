@@ -0,0 +1,416 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from utils import DEFAULT_OUTPUT_DIR
+from draft import get_profile
+from jobs import Job, JobRunner, check_cancelled
+from manifest import input_hash
+
+SERVICE_PORT = 8770
+SERVICE_WORKERS = 2
+MAX_QUEUE = 16
+CACHE_DIR = "render_cache"
+CACHE_MAX_ENTRIES = 32
+CACHE_MAX_BYTES = 2 * 2**30
+LATENCY_WINDOW = 500
+JOB_HISTORY = 256
+RETRY_AFTER_SEC = 5
+
+Renderer = Callable[[dict], str]
+
+
+def normalize_params(body: dict) -> dict:
+    bbox = [round(float(v), 4) for v in body["bbox"]]
+    if len(bbox) != 4:
+        raise ValueError("bbox needs lat_top, lat_bottom, lon_left, lon_right")
+    start_year, stop_year = int(body["start_year"]), int(body["stop_year"])
+    if start_year > stop_year:
+        raise ValueError("start_year is after stop_year")
+    return {
+        "place": str(body["place"]).strip(),
+        "title": str(body.get("title") or body["place"]).strip(),
+        "start_year": start_year,
+        "stop_year": stop_year,
+        "bbox": bbox,
+        "draft": bool(body.get("draft", False)),
+    }
+
+
+def work_place(params: dict) -> str:
+    # Jobs on the same place and box share one folder, so downloads are reused across titles and years;
+    # each video is then made from its own year range only.
+    return f"{params['place']}_{input_hash(params['bbox'])[:8]}"
+
+
+def timelapse_path(place: str, draft: bool) -> str:
+    return os.path.join(DEFAULT_OUTPUT_DIR, place, f"{place}_TimeLapse{get_profile(draft).suffix}.mp4")
+
+
+def render_timelapse(params: dict) -> str:
+    from Satellite_image import download_satellite_images
+    from Satellite_video import create_video
+
+    place = work_place(params)
+    download_satellite_images(place, params["start_year"], params["stop_year"], *params["bbox"], draft=params["draft"])
+    check_cancelled()
+    years = (params["start_year"], params["stop_year"])
+    create_video(place, params["title"], *years, draft=params["draft"], year_range=years)
+    return timelapse_path(place, params["draft"])
+
+
+def offline_renderer(thumb_url: str) -> Renderer:
+    from fake_ee_server import fake_ee
+    from utils import set_ee
+
+    # The real download and render path, with every Earth Engine call answered by the local stand-in.
+    set_ee(fake_ee(thumb_url))
+    return render_timelapse
+
+
+def percentiles(values) -> dict:
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0}
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {"count": len(ordered), "p50": pick(0.5), "p95": pick(0.95), "max": round(ordered[-1], 3)}
+
+
+class ResultCache:
+    def __init__(self, folder: str, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, tuple[Path, int]] = OrderedDict()
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._readers: dict[Path, int] = {}
+        self._evicted: set[Path] = set()
+        for path in sorted(self.folder.glob("*.mp4"), key=lambda p: p.stat().st_mtime):
+            self.entries[path.stem] = (path, path.stat().st_size)
+        self._evict()
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(size for _, size in self.entries.values())
+
+    def get(self, key: str) -> Path | None:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or not entry[0].exists():
+                self.entries.pop(key, None)
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    @contextmanager
+    def reader(self, key: str):
+        # Yields the open video, or None; an eviction meanwhile waits until the last reader is done.
+        path = self.get(key)
+        if path is None:
+            yield None
+            return
+        with self._lock:
+            self._readers[path] = self._readers.get(path, 0) + 1
+        try:
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                f = None
+            with f or nullcontext():
+                yield f
+        finally:
+            with self._lock:
+                self._readers[path] -= 1
+                if not self._readers[path]:
+                    del self._readers[path]
+                self._unlink_evicted()
+
+    def put(self, key: str, artifact: str) -> Path:
+        path = self.folder / f"{key}.mp4"
+        with self._lock:
+            self._evicted.discard(path)
+        shutil.move(artifact, path)
+        with self._lock:
+            self.entries[key] = (path, path.stat().st_size)
+            self.entries.move_to_end(key)
+            self._evict()
+        return path
+
+    def _evict(self) -> None:
+        while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            _, (path, _) = self.entries.popitem(last=False)
+            self._evicted.add(path)
+            self.evictions += 1
+        self._unlink_evicted()
+
+    def _unlink_evicted(self) -> None:
+        for path in list(self._evicted):
+            if path in self._readers:
+                continue
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                # Still open elsewhere (Windows refuses to delete open files); retried on the next eviction.
+                continue
+            self._evicted.discard(path)
+
+
+class RenderService:
+    def __init__(
+        self,
+        render: Renderer = render_timelapse,
+        workers: int = SERVICE_WORKERS,
+        max_queue: int = MAX_QUEUE,
+        cache: ResultCache | None = None
+    ):
+        self.render = render
+        self.runner = JobRunner(workers)
+        self.max_queue = max_queue
+        self.cache = cache or ResultCache(os.path.join(DEFAULT_OUTPUT_DIR, CACHE_DIR))
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+        self.inflight: dict[str, Job] = {}
+        self.counters = {
+            "requests": 0, "cache_hits": 0, "coalesced": 0, "submitted": 0,
+            "rejected": 0, "completed": 0, "failed": 0,
+        }
+        self.latency = {name: deque(maxlen=LATENCY_WINDOW) for name in ("queue_wait", "run", "total")}
+        self._lock = threading.Lock()
+        self._folder_locks: dict[str, threading.Lock] = {}
+        threading.Thread(target=self._drain_events, name="render-events", daemon=True).start()
+
+    def _drain_events(self) -> None:
+        # Nothing displays per-job progress events here; polling reads the Job objects directly.
+        while True:
+            self.runner.events.get()
+
+    def submit(self, params: dict) -> tuple[str, str, Job | None]:
+        key = input_hash(params)
+        with self._lock:
+            self.counters["requests"] += 1
+            if self.cache.get(key):
+                self.counters["cache_hits"] += 1
+                return key, "done", None
+            job = self.inflight.get(key)
+            if job is not None:
+                self.counters["coalesced"] += 1
+                return key, job.status, job
+            if self.queue_depth() >= self.max_queue:
+                self.counters["rejected"] += 1
+                return key, "rejected", None
+            job = self.runner.submit(f"render {params['place']}", self._run, key, params)
+            self.jobs[key] = self.inflight[key] = job
+            self.jobs.move_to_end(key)
+            self._prune_jobs()
+            self.counters["submitted"] += 1
+            return key, job.status, job
+
+    def _prune_jobs(self) -> None:
+        # Finished jobs are kept for status polling, oldest first out; running ones are never dropped.
+        for key in list(self.jobs):
+            if len(self.jobs) <= JOB_HISTORY:
+                break
+            if key not in self.inflight:
+                del self.jobs[key]
+
+    def _run(self, key: str, params: dict) -> str:
+        folder_lock = self._folder_locks.setdefault(work_place(params), threading.Lock())
+        try:
+            with folder_lock:
+                artifact = self.render(params)
+            if not os.path.exists(artifact):
+                raise RuntimeError("Render produced no video")
+            path = str(self.cache.put(key, artifact))
+            self._record(key, "completed")
+            return path
+        except BaseException:
+            self._record(key, "failed")
+            raise
+
+    def _record(self, key: str, outcome: str) -> None:
+        with self._lock:
+            job = self.inflight.pop(key, None)
+            self.counters[outcome] += 1
+        if job is not None and job.started:
+            now = time.time()
+            self.latency["queue_wait"].append(job.started - job.submitted)
+            self.latency["run"].append(now - job.started)
+            self.latency["total"].append(now - job.submitted)
+
+    def queue_depth(self) -> int:
+        return sum(1 for job in self.inflight.values() if job.status == "queued")
+
+    def status(self, key: str) -> dict:
+        if self.cache.get(key):
+            return {"key": key, "status": "done", "artifact": f"/artifacts/{key}.mp4"}
+        job = self.jobs.get(key)
+        if job is None:
+            return {"key": key, "status": "unknown"}
+        return {"key": key, "status": job.status, "progress": round(job.progress, 3), "message": job.message}
+
+    def metrics(self) -> dict:
+        with self._lock:
+            inflight = list(self.inflight.values())
+        return {
+            "queue_depth": sum(1 for job in inflight if job.status == "queued"),
+            "running": sum(1 for job in inflight if job.status == "running"),
+            "max_queue": self.max_queue,
+            "workers": len(self.runner._threads),
+            "counters": dict(self.counters),
+            "cache": {
+                "entries": len(self.cache.entries),
+                "bytes": self.cache.total_bytes,
+                "evictions": self.cache.evictions,
+            },
+            "latency_sec": {name: percentiles(values) for name, values in self.latency.items()},
+        }
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != "/render":
+            self.reply(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            params = normalize_params(json.loads(self.rfile.read(length) or b"{}"))
+        except (KeyError, TypeError, ValueError) as e:
+            self.reply(400, {"error": f"Bad request: {e}"})
+            return
+        key, status, job = self.server.service.submit(params)
+        if status == "rejected":
+            self.reply(429, {"key": key, "error": "Render queue is full"}, {"Retry-After": str(RETRY_AFTER_SEC)})
+        elif status == "done":
+            self.reply(200, self.server.service.status(key))
+        else:
+            self.reply(202, self.server.service.status(key))
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/metrics":
+            self.reply(200, service.metrics())
+        elif self.path.startswith("/jobs/"):
+            self.reply(200, service.status(self.path[len("/jobs/"):]))
+        elif self.path.startswith("/artifacts/"):
+            with service.cache.reader(Path(self.path).stem) as f:
+                if f is None:
+                    self.reply(404, {"error": "Not cached"})
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "video/mp4")
+                self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+                self.end_headers()
+                shutil.copyfileobj(f, self.wfile)
+        else:
+            self.reply(404, {"error": "Not found"})
+
+    def reply(self, status: int, body: dict, headers: dict | None = None) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_service(service: RenderService, port: int = SERVICE_PORT) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", port), RenderHandler)
+    server.daemon_threads = True
+    server.service = service
+    threading.Thread(target=server.serve_forever, name="render-service", daemon=True).start()
+    return server
+
+
+def run_demo(clients: int, places: int) -> bool:
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+    from fake_ee_server import start_server
+
+    imagery = start_server(max_concurrent=4, rate=100)
+    service = RenderService(offline_renderer(f"http://127.0.0.1:{imagery.server_address[1]}/thumb"))
+    server = start_service(service, port=0)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    def call(method: str, path: str, body: dict | None = None) -> tuple[int, dict]:
+        data = json.dumps(body).encode() if body is not None else None
+        try:
+            with urlopen(Request(base + path, data=data, method=method), timeout=60) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def client(i: int) -> str:
+        # Many users asking for the same few places at once.
+        body = {
+            "place": f"demo{i % places}", "title": "Demo", "start_year": 2000, "stop_year": 2002,
+            "bbox": [22.8 + i % places, 23.1 + i % places, -110.1, -109.5], "draft": True,
+        }
+        status, reply = call("POST", "/render", body)
+        while status in (202, 429) or reply.get("status") in ("queued", "running"):
+            time.sleep(0.2)
+            status, reply = call("POST", "/render", body) if status == 429 else call("GET", f"/jobs/{reply['key']}")
+        return reply["status"]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        results = list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - start
+    metrics = service.metrics()
+    server.shutdown()
+    imagery.shutdown()
+
+    print(f"{results.count('done')}/{clients} clients got a video in {elapsed:.2f} s")
+    print(json.dumps(metrics, indent=1))
+    return results.count("done") == clients and metrics["counters"]["submitted"] == places
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP service that renders timelapses with coalescing and a result cache.")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    parser.add_argument("--max-queue", type=int, default=MAX_QUEUE)
+    parser.add_argument("--cache-entries", type=int, default=CACHE_MAX_ENTRIES)
+    parser.add_argument("--offline", action="store_true", help="Render from the local imagery stand-in instead of Earth Engine")
+    parser.add_argument("--demo", action="store_true", help="Fire concurrent duplicate requests offline and print the metrics")
+    parser.add_argument("--clients", type=int, default=24)
+    parser.add_argument("--places", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.demo:
+        sys.exit(0 if run_demo(args.clients, args.places) else 1)
+
+    render = render_timelapse
+    if args.offline:
+        from fake_ee_server import start_server
+        imagery = start_server()
+        render = offline_renderer(f"http://127.0.0.1:{imagery.server_address[1]}/thumb")
+    cache = ResultCache(os.path.join(DEFAULT_OUTPUT_DIR, CACHE_DIR), args.cache_entries)
+    service = RenderService(render, args.workers, args.max_queue, cache)
+    server = start_service(service, args.port)
+    print(f"Render service on http://127.0.0.1:{args.port} (POST /render, GET /jobs/<key>, /artifacts/<key>.mp4, /metrics)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        service.runner.shutdown()
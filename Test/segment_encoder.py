@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Hashable
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from jobs import JobCancelled, check_cancelled, report_progress
+from tracing import add_spans, capture_spans, span
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Segments are encoded by FFmpeg with a fixed GOP, no scene-cut keyframes and no B-frames, so every
+# segment starts on a closed GOP and the pieces join with a stream copy.
+KEYFRAME_INTERVAL = 12
+# MPEG-4 Part 2 at a fixed quantizer: no rate control state carries across a segment boundary.
+SEGMENT_QUALITY = 3
+SEGMENT_SEC = 10.0
+# Parallel encoding is opt-in; 1 keeps the single-process OpenCV writer.
+ENCODE_WORKERS = int(os.environ.get("SATELLITE_ENCODE_WORKERS", "1")) or 1
+POLL_SEC = 0.5
+CHECK_MIN_PSNR = 30.0
+
+Run = tuple[Hashable, int]
+Renderer = Callable[[Hashable, Any, dict], "np.ndarray | None"]
+
+# Set in encoder worker processes: (frames written across all workers, cancel event).
+_worker_state = None
+
+
+def find_ffmpeg() -> str | None:
+    path = shutil.which("ffmpeg")
+    if path:
+        return path
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        return None
+
+
+def timeline_frames(runs: list[Run]) -> int:
+    return sum(count for _, count in runs)
+
+
+def slice_runs(runs: list[Run], start: int, stop: int) -> list[Run]:
+    sliced = []
+    pos = 0
+    for key, count in runs:
+        lo, hi = max(pos, start), min(pos + count, stop)
+        if lo < hi:
+            sliced.append((key, hi - lo))
+        pos += count
+    return sliced
+
+
+def split_segments(runs: list[Run], segment_frames: int) -> list[list[Run]]:
+    segment_frames = max(KEYFRAME_INTERVAL, segment_frames - segment_frames % KEYFRAME_INTERVAL)
+    total = timeline_frames(runs)
+    return [slice_runs(runs, start, start + segment_frames) for start in range(0, total, segment_frames)]
+
+
+def _init_worker(frames_done, cancel) -> None:
+    global _worker_state
+    _worker_state = (frames_done, cancel)
+
+
+def _check_cancelled() -> None:
+    if _worker_state is None:
+        check_cancelled()
+    elif _worker_state[1].is_set():
+        raise JobCancelled("Encoding cancelled")
+
+
+def _report(done: int, total: int, count: int) -> None:
+    if _worker_state is None:
+        report_progress(done, total, "encoding")
+        return
+    with _worker_state[0].get_lock():
+        _worker_state[0].value += count
+
+
+def ffmpeg_writer(ffmpeg: str, path: str, fps: float, size: tuple[int, int]) -> subprocess.Popen:
+    w, h = size
+    return subprocess.Popen(
+        [
+            ffmpeg, "-v", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}", "-r", f"{fps}", "-i", "-",
+            "-c:v", "mpeg4", "-q:v", str(SEGMENT_QUALITY),
+            "-g", str(KEYFRAME_INTERVAL), "-sc_threshold", "0", "-bf", "0",
+            "-pix_fmt", "yuv420p", path,
+        ],
+        stdin=subprocess.PIPE,
+    )
+
+
+def encode_segment(
+    path: str,
+    runs: list[Run],
+    render: Renderer,
+    context: Any,
+    fps: float,
+    size: tuple[int, int],
+    ffmpeg: str | None = None
+) -> int:
+    import cv2
+
+    cache: dict = {}
+    total = timeline_frames(runs)
+    if ffmpeg:
+        proc = ffmpeg_writer(ffmpeg, path, fps, size)
+        write = proc.stdin.write
+    else:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+        write = writer.write
+    written = 0
+    try:
+        for key, count in runs:
+            _check_cancelled()
+            frame = render(key, context, cache)
+            if frame is None:
+                continue
+            with span("encode", frames=count):
+                if ffmpeg:
+                    if (frame.shape[1], frame.shape[0]) != size:
+                        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                    frame = frame.tobytes()
+                for _ in range(count):
+                    write(frame)
+            written += count
+            _report(written, total, count)
+    finally:
+        if ffmpeg:
+            proc.stdin.close()
+            if proc.wait() != 0:
+                raise RuntimeError(f"ffmpeg failed encoding {path}")
+        else:
+            writer.release()
+    return written
+
+
+def encode_segment_traced(*args) -> tuple[int, list[dict]]:
+    # Runs in a worker process; its spans go back to the parent's trace with the result.
+    with capture_spans("segment") as spans:
+        written = encode_segment(*args)
+    return written, spans
+
+
+def concat_segments(ffmpeg: str, paths: list[str], outfile: str) -> None:
+    list_file = os.path.join(os.path.dirname(paths[0]), "segments.txt")
+    with open(list_file, "w", encoding="utf-8") as f:
+        for p in paths:
+            # The concat demuxer reads single-quoted paths; a quote inside one is written as '\''.
+            quoted = Path(p).as_posix().replace("'", "'\\''")
+            f.write(f"file '{quoted}'\n")
+    subprocess.run(
+        [ffmpeg, "-v", "error", "-y", "-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy", outfile],
+        check=True,
+    )
+
+
+def encode_timeline(
+    outfile: str,
+    runs: list[Run],
+    render: Renderer,
+    context: Any,
+    fps: float,
+    size: tuple[int, int],
+    workers: int | None = None,
+    segment_sec: float = SEGMENT_SEC
+) -> int:
+    workers = workers or ENCODE_WORKERS
+    segments = split_segments(runs, int(round(segment_sec * fps)))
+    ffmpeg = find_ffmpeg() if workers > 1 and len(segments) > 1 else None
+    if ffmpeg is None:
+        return encode_segment(outfile, runs, render, context, fps, size)
+
+    import multiprocessing
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    seg_dir = Path(outfile).with_name(f".segments_{Path(outfile).stem}")
+    seg_dir.mkdir(exist_ok=True)
+    paths = [str(seg_dir / f"segment_{i:04d}.mp4") for i in range(len(segments))]
+    total = timeline_frames(runs)
+    print(f"Encoding {len(segments)} segments on {min(workers, len(segments))} processes...")
+
+    frames_done = multiprocessing.Value("q", 0)
+    cancel = multiprocessing.Event()
+    pool = ProcessPoolExecutor(min(workers, len(segments)), initializer=_init_worker, initargs=(frames_done, cancel))
+    try:
+        with span("encode_segments", frames=total, segments=len(segments)):
+            pending = {
+                pool.submit(encode_segment_traced, path, seg, render, context, fps, size, ffmpeg)
+                for path, seg in zip(paths, segments)
+            }
+            written = 0
+            while pending:
+                try:
+                    check_cancelled()
+                except JobCancelled:
+                    cancel.set()
+                    raise
+                done, pending = wait(pending, timeout=POLL_SEC, return_when=FIRST_COMPLETED)
+                for future in done:
+                    count, spans = future.result()
+                    written += count
+                    add_spans(spans)
+                report_progress(frames_done.value, total, "encoding segments")
+        with span("concat", segments=len(segments)):
+            concat_segments(ffmpeg, paths, outfile)
+    except BaseException:
+        cancel.set()
+        raise
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(seg_dir, ignore_errors=True)
+    return written
+
+
+def read_video(path: str) -> list[np.ndarray]:
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def synthetic_render(key: int, context: tuple[int, int], cache: dict) -> np.ndarray:
+    import cv2
+    import numpy as np
+
+    w, h = context
+    rng = np.random.default_rng(key)
+    frame = np.full((h, w, 3), rng.integers(0, 255, 3), np.uint8)
+    cv2.circle(frame, (int(rng.integers(w)), int(rng.integers(h))), h // 3, rng.integers(0, 255, 3).tolist(), -1)
+    cv2.putText(frame, str(key), (20, h - 20), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3, cv2.LINE_AA)
+    return frame
+
+
+def check_parallel(workers: int = 4, segment_sec: float = 2.0, size: tuple[int, int] = (640, 360), fps: float = 30) -> bool:
+    import tempfile
+    import numpy as np
+
+    # Irregular run lengths put image changes off the GOP grid, where a scene-cut keyframe would go.
+    rng = np.random.default_rng(0)
+    runs = [(i, int(n)) for i, n in enumerate(rng.integers(1, 40, 60))]
+    with tempfile.TemporaryDirectory(prefix="segment_check_") as folder:
+        paths = {name: os.path.join(folder, f"{name.replace(' ', '_')}.mp4") for name in ("serial", "one segment", "parallel")}
+        encode_timeline(paths["serial"], runs, synthetic_render, size, fps, size, 1)
+        encode_segment(paths["one segment"], runs, synthetic_render, size, fps, size, find_ffmpeg())
+        encode_timeline(paths["parallel"], runs, synthetic_render, size, fps, size, workers, segment_sec)
+        outputs = {name: read_video(path) for name, path in paths.items()}
+
+    expected = timeline_frames(runs)
+    ok = True
+    for name, frames in outputs.items():
+        print(f"{name}: {len(frames)} frames (timeline {expected})")
+        ok = ok and len(frames) == expected
+    if not ok:
+        return False
+
+    def psnr(a: np.ndarray, b: np.ndarray) -> float:
+        mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+        return float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+    # Each segment's encoder starts fresh, so frames after a join are not bit-identical to one
+    # continuous encode; they must still show the same picture at every timestamp.
+    parallel = outputs["parallel"]
+    for name in ("one segment", "serial"):
+        scores = [psnr(a, b) for a, b in zip(outputs[name], parallel)]
+        worst = min(scores)
+        print(f"parallel vs {name}: worst frame PSNR {worst:.1f} dB at frame {scores.index(worst)} (minimum {CHECK_MIN_PSNR:.0f})")
+        ok = ok and worst >= CHECK_MIN_PSNR
+    return ok
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check that a parallel segmented encode matches a serial one.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--segment-sec", type=float, default=2.0)
+    args = parser.parse_args()
+
+    if find_ffmpeg() is None:
+        print("No ffmpeg on PATH and imageio-ffmpeg is not installed; parallel encoding is unavailable.")
+        sys.exit(1)
+    sys.exit(0 if check_parallel(args.workers, args.segment_sec) else 1)
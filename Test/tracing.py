@@ -0,0 +1,158 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+TRACE_DIR = "traces"
+
+_local = threading.local()
+last_trace = None
+
+
+class Tracer:
+    def __init__(self, job: str):
+        self.job = job
+        self.output_dir: str | None = None
+        self.spans: list[dict] = []
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self._epoch = time.time()
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append({
+                    "job": self.job,
+                    "name": name,
+                    "start": self._epoch + (start - self._t0),
+                    "duration": end - start,
+                    "thread": threading.get_ident(),
+                    "attrs": attrs,
+                })
+
+    def export_jsonl(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for span in self.spans:
+                f.write(json.dumps(span, default=str) + "\n")
+
+    def export_chrome(self, path: str) -> None:
+        pid = os.getpid()
+        events = [
+            {
+                "name": span["name"],
+                "cat": self.job,
+                "ph": "X",
+                "ts": int((span["start"] - self._epoch) * 1e6),
+                "dur": int(span["duration"] * 1e6),
+                "pid": pid,
+                "tid": span["thread"],
+                "args": span["attrs"],
+            }
+            for span in self.spans
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, default=str)
+
+    def stage_totals(self) -> dict[str, float]:
+        totals: dict[str, float] = {}
+        for span in self.spans:
+            totals[span["name"]] = totals.get(span["name"], 0.0) + span["duration"]
+        return totals
+
+    def summary(self) -> str:
+        wall = time.perf_counter() - self._t0
+        counts: dict[str, int] = {}
+        longest: dict[str, float] = {}
+        for span in self.spans:
+            counts[span["name"]] = counts.get(span["name"], 0) + 1
+            longest[span["name"]] = max(longest.get(span["name"], 0.0), span["duration"])
+
+        lines = [f"Trace summary: {self.job} ({wall:.2f} s wall)"]
+        lines.append(f"{'stage':<16}{'count':>7}{'total s':>10}{'mean ms':>10}{'max ms':>10}{'% wall':>8}")
+        for name, total in sorted(self.stage_totals().items(), key=lambda kv: -kv[1]):
+            n = counts[name]
+            share = 100 * total / wall if wall else 0.0
+            lines.append(f"{name:<16}{n:>7}{total:>10.2f}{total / n * 1000:>10.1f}{longest[name] * 1000:>10.1f}{share:>8.1f}")
+        return "\n".join(lines)
+
+    def export(self) -> None:
+        if not self.output_dir or not self.spans:
+            return
+        trace_dir = os.path.join(self.output_dir, TRACE_DIR)
+        os.makedirs(trace_dir, exist_ok=True)
+        stem = os.path.join(trace_dir, f"{self.job}_{datetime.now():%Y%m%d_%H%M%S}")
+        self.export_jsonl(f"{stem}.jsonl")
+        self.export_chrome(f"{stem}.trace.json")
+
+
+def current_tracer() -> Tracer | None:
+    return getattr(_local, "tracer", None)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    tracer = current_tracer()
+    if tracer is None:
+        yield attrs
+        return
+    with tracer.span(name, **attrs) as span_attrs:
+        yield span_attrs
+
+
+@contextmanager
+def capture_spans(job: str):
+    # Records spans in a process with no traced job, such as an encoder worker, so they can be sent back.
+    previous = current_tracer()
+    tracer = Tracer(job)
+    _local.tracer = tracer
+    try:
+        yield tracer.spans
+    finally:
+        _local.tracer = previous
+
+
+def add_spans(spans: list[dict]) -> None:
+    tracer = current_tracer()
+    if tracer is None:
+        return
+    with tracer._lock:
+        tracer.spans.extend(span | {"job": tracer.job} for span in spans)
+
+
+def set_trace_output(output_dir: str) -> None:
+    tracer = current_tracer()
+    if tracer is not None and tracer.output_dir is None:
+        tracer.output_dir = output_dir
+
+
+def traced_job(job: str):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            global last_trace
+            if current_tracer() is not None:
+                return func(*args, **kwargs)
+
+            tracer = Tracer(job)
+            _local.tracer = tracer
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _local.tracer = None
+                last_trace = tracer
+                if tracer.spans:
+                    print(tracer.summary())
+                    try:
+                        tracer.export()
+                    except OSError as e:
+                        print(f"Could not write trace: {e}")
+        return wrapper
+    return decorator
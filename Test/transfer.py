@@ -0,0 +1,59 @@
+import math
+
+METERS_PER_DEGREE = 111320
+LANDSAT_SCALE_M = 30
+# NOAA CFSv2 is on a 0.2 degree grid.
+CFSV2_SCALE_M = 0.2 * METERS_PER_DEGREE
+MIN_REQUEST_PX = 64
+TRANSFER_FORMATS = ("png", "jpg")
+# Earth Engine rejects thumbnail requests whose uncompressed RGB payload exceeds this.
+EE_MAX_REQUEST_BYTES = 50331648
+
+
+def aoi_extent_m(bbox: tuple[float, float, float, float]) -> tuple[float, float]:
+    lat_top, lat_bottom, lon_left, lon_right = bbox
+    mid_lat = math.radians((lat_top + lat_bottom) / 2)
+    width = abs(lon_right - lon_left) * METERS_PER_DEGREE * math.cos(mid_lat)
+    height = abs(lat_top - lat_bottom) * METERS_PER_DEGREE
+    return width, height
+
+
+def native_px(extent_m: float, scale_m: float, oversample: float = 1.0) -> int:
+    return max(MIN_REQUEST_PX, math.ceil(extent_m / scale_m * oversample))
+
+
+def request_dimensions(
+    bbox: tuple[float, float, float, float],
+    scale_m: float,
+    max_dimensions: int,
+    oversample: float = 1.0
+) -> int:
+    # Never ask for more pixels along the long side than the sensor resolves or the output uses.
+    return min(max_dimensions, native_px(max(aoi_extent_m(bbox)), scale_m, oversample))
+
+
+def request_size(
+    bbox: tuple[float, float, float, float],
+    scale_m: float,
+    output_size: tuple[int, int],
+    oversample: float = 1.0
+) -> tuple[int, int]:
+    width_m, height_m = aoi_extent_m(bbox)
+    out_w, out_h = output_size
+    return min(out_w, native_px(width_m, scale_m, oversample)), min(out_h, native_px(height_m, scale_m, oversample))
+
+
+def filmstrip_frames_per_request(dimensions: int) -> int:
+    # Sized for square frames, the most a request at these dimensions can return whatever the projection.
+    return max(1, EE_MAX_REQUEST_BYTES // (dimensions * dimensions * 3))
+
+
+def check_format(transfer_format: str) -> str:
+    if transfer_format not in TRANSFER_FORMATS:
+        raise ValueError(f"Unsupported transfer format: {transfer_format} (use one of {', '.join(TRANSFER_FORMATS)})")
+    return transfer_format
+
+
+def format_transfer(total_bytes: int, frames: int, transfer_format: str) -> str:
+    per_frame = total_bytes / frames if frames else 0
+    return f"{total_bytes / 1e6:.1f} MB as {transfer_format.upper()}, {per_frame / 1e3:.0f} KB/frame over {frames} frames"
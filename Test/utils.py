@@ -1,13 +1,91 @@
+import os
+import queue
+import threading
 import tkinter as tk
 from tkinter import messagebox
 from typing import Callable
 
-DEFAULT_OUTPUT_DIR = r"C:\Users\Public\Documents"
+DEFAULT_OUTPUT_DIR = os.environ.get("SATELLITE_OUTPUT_DIR", r"C:\Users\Public\Documents")
+EE_PROJECT = "solid-bliss-390413"
 
-def get_text_input(title: str, labels: list[str], defaults: list[str]) -> list[str]:
-    root = tk.Tk()
+MAP_PORT = 8000
+
+_ee_lock = threading.Lock()
+_ee_module = None
+_map_lock = threading.Lock()
+_map_server = None
+
+
+def get_ee():
+    global _ee_module
+    with _ee_lock:
+        if _ee_module is None:
+            import ee
+            ee.Initialize(project=EE_PROJECT)
+            _ee_module = ee
+    return _ee_module
+
+
+def set_ee(module) -> None:
+    # Points every Earth Engine call at a stand-in, such as the offline render service's fake server.
+    global _ee_module
+    with _ee_lock:
+        _ee_module = module
+
+
+class DialogCancelled(Exception):
+    pass
+
+
+def open_dialog(title: str, master: tk.Misc | None = None) -> tk.Misc:
+    root = tk.Tk() if master is None else tk.Toplevel(master)
     root.title(title)
     root.resizable(False, False)
+    root.dialog_result = tk.StringVar(master=root)
+    root.protocol("WM_DELETE_WINDOW", lambda: root.dialog_result.set("closed"))
+    return root
+
+
+def submit_dialog(root: tk.Misc) -> None:
+    root.dialog_result.set("ok")
+
+
+def wait_dialog(root: tk.Misc) -> None:
+    root.wait_variable(root.dialog_result)
+    if root.dialog_result.get() != "ok":
+        root.destroy()
+        raise DialogCancelled("Dialog closed without submitting")
+
+
+def run_in_background(root: tk.Misc, func: Callable[[], object], on_done: Callable[[object], None], poll_ms: int = 200) -> None:
+    # on_done gets the result, or the exception, on the Tk thread; nothing is called once the dialog is gone.
+    results: queue.Queue = queue.Queue()
+
+    def work():
+        try:
+            results.put(func())
+        except Exception as e:
+            results.put(e)
+
+    def poll():
+        try:
+            if not root.winfo_exists():
+                return
+        except tk.TclError:
+            return
+        try:
+            result = results.get_nowait()
+        except queue.Empty:
+            root.after(poll_ms, poll)
+            return
+        on_done(result)
+
+    threading.Thread(target=work, daemon=True).start()
+    root.after(poll_ms, poll)
+
+
+def get_text_input(title: str, labels: list[str], defaults: list[str], master: tk.Misc | None = None) -> list[str]:
+    root = open_dialog(title, master)
 
     entries = []
     for i, (txt, default) in enumerate(zip(labels, defaults)):
@@ -17,33 +95,28 @@ def get_text_input(title: str, labels: list[str], defaults: list[str]) -> list[s
         e.grid(row=i, column=1, padx=8, pady=4)
         entries.append(e)
 
-    def submit():
-        root.quit()
-
-    tk.Button(root, text="OK", width=10, command=submit).grid(
+    tk.Button(root, text="OK", width=10, command=lambda: submit_dialog(root)).grid(
         row=len(labels), columnspan=2, pady=10
     )
-    root.mainloop()
+    wait_dialog(root)
 
     vals = [e.get().strip() for e in entries]
     root.destroy()
     return vals
 
 
-def get_video_inputs() -> tuple[str, str, int, int]:
+def get_video_inputs(master: tk.Misc | None = None) -> tuple[str, str, int, int]:
     defaults = ["Cabo", "Cabo, Mexico", 1992, 2025]
     labels = ["Place name:", "Title:", "Start year:", "Stop year:"]
-    vals = get_text_input("Timelapse parameters", labels, defaults)
+    vals = get_text_input("Timelapse parameters", labels, defaults, master)
     return vals[0], vals[1], int(vals[2]), int(vals[3])
 
 
-def get_thumbnail_inputs() -> tuple[str, str, int]:
-    defaults = ["mecca", "Cabo, Mexico\nTimelapse", 2025]
-    labels = ["Folder:", "Caption:", "Year:"]
+def get_thumbnail_inputs(master: tk.Misc | None = None) -> tuple[str, str, int | None]:
+    defaults = ["mecca", "Cabo, Mexico\nTimelapse", "auto"]
+    labels = ["Folder:", "Caption:", "Year (or auto):"]
     
-    root = tk.Tk()
-    root.title("Thumbnail parameters")
-    root.resizable(False, False)
+    root = open_dialog("Thumbnail parameters", master)
 
     entries = []
     for i, (txt, default) in enumerate(zip(labels, defaults)):
@@ -57,11 +130,8 @@ def get_thumbnail_inputs() -> tuple[str, str, int]:
         e.grid(row=i, column=1, padx=8, pady=4)
         entries.append(e)
 
-    def submit():
-        root.quit()
-
-    tk.Button(root, text="OK", width=10, command=submit).grid(row=len(labels), columnspan=2, pady=10)
-    root.mainloop()
+    tk.Button(root, text="OK", width=10, command=lambda: submit_dialog(root)).grid(row=len(labels), columnspan=2, pady=10)
+    wait_dialog(root)
 
     vals = []
     for e in entries:
@@ -70,67 +140,129 @@ def get_thumbnail_inputs() -> tuple[str, str, int]:
         else:
             vals.append(e.get().strip())
     root.destroy()
-    return vals[0], vals[1], int(vals[2])
+    year = None if vals[2].lower() in ("", "auto") else int(vals[2])
+    return vals[0], vals[1], year
 
 
-def get_satellite_image_inputs() -> tuple[str, int, int, float, float, float, float]:
-    root = tk.Tk()
-    root.title("Landsat composite parameters")
+def get_satellite_image_inputs(master: tk.Misc | None = None) -> tuple[str, int, int, float, float, float, float]:
+    root = open_dialog("Landsat composite parameters", master)
 
     tk.Label(root, text="Place name:").grid(row=0, column=0, sticky="e")
-    place_var = tk.StringVar(value="test")
+    place_var = tk.StringVar(master=root, value="test")
     tk.Entry(root, textvariable=place_var, width=25).grid(row=0, column=1)
 
     tk.Label(root, text="Start year:").grid(row=1, column=0, sticky="e")
-    start_var = tk.IntVar(value=2024)
+    start_var = tk.IntVar(master=root, value=2024)
     tk.Spinbox(root, from_=1980, to=2030, textvariable=start_var, width=15).grid(row=1, column=1)
 
     tk.Label(root, text="Stop year:").grid(row=2, column=0, sticky="e")
-    stop_var = tk.IntVar(value=2024)
+    stop_var = tk.IntVar(master=root, value=2024)
     tk.Spinbox(root, from_=1980, to=2030, textvariable=stop_var, width=15).grid(row=2, column=1)
 
     tk.Label(root, text="Lat top:").grid(row=3, column=0, sticky="e")
-    lat_top_var = tk.DoubleVar(value=22.8474)
+    lat_top_var = tk.DoubleVar(master=root, value=22.8474)
     tk.Entry(root, textvariable=lat_top_var, width=15).grid(row=3, column=1)
 
     tk.Label(root, text="Lat bottom:").grid(row=4, column=0, sticky="e")
-    lat_bottom_var = tk.DoubleVar(value=23.1716)
+    lat_bottom_var = tk.DoubleVar(master=root, value=23.1716)
     tk.Entry(root, textvariable=lat_bottom_var, width=15).grid(row=4, column=1)
 
     tk.Label(root, text="Lon left:").grid(row=5, column=0, sticky="e")
-    lon_left_var = tk.DoubleVar(value=-110.1356)
+    lon_left_var = tk.DoubleVar(master=root, value=-110.1356)
     tk.Entry(root, textvariable=lon_left_var, width=15).grid(row=5, column=1)
 
     tk.Label(root, text="Lon right:").grid(row=6, column=0, sticky="e")
-    lon_right_var = tk.DoubleVar(value=-109.5602)
+    lon_right_var = tk.DoubleVar(master=root, value=-109.5602)
     tk.Entry(root, textvariable=lon_right_var, width=15).grid(row=6, column=1)
 
     tk.Label(root, text="Lon / Lat ratio:").grid(row=7, column=0, sticky="e")
-    ratio_var = tk.StringVar(value="")
+    ratio_var = tk.StringVar(master=root, value="")
     ratio_entry = tk.Entry(root, textvariable=ratio_var, width=15, state="readonly")
     ratio_entry.grid(row=7, column=1)
 
+    tk.Label(root, text="Estimate:").grid(row=8, column=0, sticky="ne")
+    estimate_var = tk.StringVar(master=root, value="")
+    tk.Label(root, textvariable=estimate_var, justify="left").grid(row=8, column=1, sticky="w")
+
+    from planner import Calibration, calibrate, plan_satellite_job
+    # Defaults until the trace files are read in the background.
+    calibration = Calibration()
+
     def update_ratio(*_):
         try:
             lat_diff = abs(lat_bottom_var.get() - lat_top_var.get())
             lon_diff = abs(lon_right_var.get() - lon_left_var.get())
             ratio = lon_diff / lat_diff if lat_diff else float("inf")
             ratio_var.set(f"{ratio:.4f}")
-        except tk.TclError:
+            bbox = (lat_top_var.get(), lat_bottom_var.get(), lon_left_var.get(), lon_right_var.get())
+            plan = plan_satellite_job(bbox, start_var.get(), stop_var.get(), calibration=calibration)
+            estimate_var.set(
+                f"{plan.requests} requests, {plan.download_bytes / 1e6:.0f} MB\n"
+                f"{plan.disk_bytes / 1e6:.0f} MB on disk, ~{plan.total_seconds / 60:.1f} min"
+            )
+        except (tk.TclError, ZeroDivisionError):
             ratio_var.set("Err")
+            estimate_var.set("")
 
-    for var in (lat_top_var, lat_bottom_var, lon_left_var, lon_right_var):
+    for var in (start_var, stop_var, lat_top_var, lat_bottom_var, lon_left_var, lon_right_var):
         var.trace_add("write", update_ratio)
     update_ratio()
 
-    def launch_map():
-        open_map()
-        messagebox.showinfo("Instructions", "Click the map to see lat/lon.\nCopy them into the input boxes manually.")
+    def calibrated(result):
+        nonlocal calibration
+        if isinstance(result, Calibration):
+            calibration = result
+            update_ratio()
 
-    tk.Button(root, text="Open Map", command=launch_map).grid(row=8, column=0, columnspan=2, pady=6)
-    tk.Button(root, text="OK", command=root.quit).grid(row=9, column=0, columnspan=2, pady=6)
+    run_in_background(root, calibrate, calibrated)
+
+    def launch_map():
+        try:
+            bounds = (lat_top_var.get(), lat_bottom_var.get(), lon_left_var.get(), lon_right_var.get())
+        except tk.TclError:
+            bounds = None
+        open_map(bounds)
+        messagebox.showinfo("Instructions", "Click the map to see lat/lon.\nCopy them into the input boxes manually.", parent=root)
+
+    preview_label = tk.Label(root, text="")
+    preview_label.grid(row=9, column=0, columnspan=2, pady=4)
+
+    def fetch_preview(bounds):
+        from Satellite_image import preview_composite
+        return preview_composite(*bounds)
+
+    def show_preview(result):
+        preview_button.config(state="normal")
+        if isinstance(result, Exception):
+            preview_label.config(image="", text=f"Preview failed: {result}")
+        elif result is None:
+            preview_label.config(image="", text="No Landsat scenes for this area in recent years")
+        else:
+            import io
+            from PIL import Image, ImageTk
+            year, data = result
+            preview_label.image = ImageTk.PhotoImage(Image.open(io.BytesIO(data)), master=root)
+            preview_label.config(image=preview_label.image, text=str(year), compound="top")
 
-    root.mainloop()
+    def launch_preview():
+        try:
+            bounds = (lat_top_var.get(), lat_bottom_var.get(), lon_left_var.get(), lon_right_var.get())
+        except tk.TclError:
+            messagebox.showerror("Preview", "Enter valid coordinates first.", parent=root)
+            return
+        preview_button.config(state="disabled")
+        preview_label.config(image="", text="Fetching preview...")
+        # Polling stops once the dialog is closed, so a slow preview never touches destroyed widgets.
+        run_in_background(root, lambda: fetch_preview(bounds), show_preview)
+
+    buttons = tk.Frame(root)
+    buttons.grid(row=10, column=0, columnspan=2, pady=6)
+    tk.Button(buttons, text="Open Map", command=launch_map).pack(side="left", padx=4)
+    preview_button = tk.Button(buttons, text="Preview", command=launch_preview)
+    preview_button.pack(side="left", padx=4)
+    tk.Button(root, text="OK", command=lambda: submit_dialog(root)).grid(row=11, column=0, columnspan=2, pady=6)
+
+    wait_dialog(root)
 
     result = (
         place_var.get().strip() or "Unknown",
@@ -145,64 +277,78 @@ def get_satellite_image_inputs() -> tuple[str, int, int, float, float, float, fl
     return result
 
 
-def open_map():
-    import threading
-    from http.server import SimpleHTTPRequestHandler
-    import socketserver
+def ensure_map_server() -> tuple[str, int]:
+    global _map_server
+    import functools
+    import tempfile
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    with _map_lock:
+        if _map_server is None:
+            map_dir = tempfile.mkdtemp(prefix="satellite_map_")
+            handler = functools.partial(SimpleHTTPRequestHandler, directory=map_dir)
+            try:
+                server = ThreadingHTTPServer(("127.0.0.1", MAP_PORT), handler)
+            except OSError:
+                # Port taken (often by an older launcher); any free port will do.
+                server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="map-server", daemon=True).start()
+            print(f"Serving map on http://localhost:{server.server_address[1]}")
+            _map_server = (server, map_dir)
+        server, map_dir = _map_server
+    return map_dir, server.server_address[1]
+
+
+def open_map(bounds: tuple[float, float, float, float] | None = None):
     import webbrowser
     import folium
 
-    PORT = 8000
-
-    def serve_map():
-        handler = SimpleHTTPRequestHandler
-        with socketserver.TCPServer(("", PORT), handler) as httpd:
-            print(f"Serving map on http://localhost:{PORT}")
-            httpd.serve_forever()
-
-    m = folium.Map(location=[22.8474, -109.5602], zoom_start=8)
+    map_dir, port = ensure_map_server()
+    if bounds:
+        lat_top, lat_bottom, lon_left, lon_right = bounds
+        m = folium.Map(location=[(lat_top + lat_bottom) / 2, (lon_left + lon_right) / 2], zoom_start=8)
+        folium.Rectangle([[lat_top, lon_left], [lat_bottom, lon_right]], color="red", fill=False).add_to(m)
+    else:
+        m = folium.Map(location=[22.8474, -109.5602], zoom_start=8)
     folium.LatLngPopup().add_to(m)
-    map_file = "map.html"
-    m.save(map_file)
-    
-    threading.Thread(target=serve_map, daemon=True).start()
-    webbrowser.open(f"http://localhost:{PORT}/{map_file}")
+    m.save(os.path.join(map_dir, "map.html"))
+    webbrowser.open(f"http://localhost:{port}/map.html")
 
 
-def get_weather_inputs() -> tuple[str, int, int, float, float, float, float]:
-    root = tk.Tk()
-    root.title("Weather parameters")
+def get_weather_inputs(master: tk.Misc | None = None) -> tuple[str, int, int, float, float, float, float]:
+    root = open_dialog("Weather parameters", master)
 
     tk.Label(root, text="Place name:").grid(row=0, column=0, sticky="e")
-    place_var = tk.StringVar(value="USA")
+    place_var = tk.StringVar(master=root, value="USA")
     tk.Entry(root, textvariable=place_var, width=25).grid(row=0, column=1)
 
     tk.Label(root, text="Year:").grid(row=1, column=0, sticky="e")
-    year_var = tk.IntVar(value=2024)
+    year_var = tk.IntVar(master=root, value=2024)
     tk.Spinbox(root, from_=1980, to=2030, textvariable=year_var, width=15).grid(row=1, column=1)
 
     tk.Label(root, text="Month:").grid(row=2, column=0, sticky="e")
-    month_var = tk.IntVar(value=12)
+    month_var = tk.IntVar(master=root, value=12)
     tk.Spinbox(root, from_=1, to=12, textvariable=month_var, width=15).grid(row=2, column=1)
 
     tk.Label(root, text="Lat top:").grid(row=3, column=0, sticky="e")
-    lat_top_var = tk.DoubleVar(value=52.0)
+    lat_top_var = tk.DoubleVar(master=root, value=52.0)
     tk.Entry(root, textvariable=lat_top_var, width=15).grid(row=3, column=1)
 
     tk.Label(root, text="Lat bottom:").grid(row=4, column=0, sticky="e")
-    lat_bottom_var = tk.DoubleVar(value=24.0)
+    lat_bottom_var = tk.DoubleVar(master=root, value=24.0)
     tk.Entry(root, textvariable=lat_bottom_var, width=15).grid(row=4, column=1)
 
     tk.Label(root, text="Lon left:").grid(row=5, column=0, sticky="e")
-    lon_left_var = tk.DoubleVar(value=-125.0)
+    lon_left_var = tk.DoubleVar(master=root, value=-125.0)
     tk.Entry(root, textvariable=lon_left_var, width=15).grid(row=5, column=1)
 
     tk.Label(root, text="Lon right:").grid(row=6, column=0, sticky="e")
-    lon_right_var = tk.DoubleVar(value=-66.0)
+    lon_right_var = tk.DoubleVar(master=root, value=-66.0)
     tk.Entry(root, textvariable=lon_right_var, width=15).grid(row=6, column=1)
 
     tk.Label(root, text="Lon / Lat ratio:").grid(row=7, column=0, sticky="e")
-    ratio_var = tk.StringVar(value="")
+    ratio_var = tk.StringVar(master=root, value="")
     ratio_entry = tk.Entry(root, textvariable=ratio_var, width=15, state="readonly")
     ratio_entry.grid(row=7, column=1)
 
@@ -220,13 +366,17 @@ def get_weather_inputs() -> tuple[str, int, int, float, float, float, float]:
     update_ratio()
 
     def launch_map():
-        open_map()
-        messagebox.showinfo("Instructions", "Click the map to see lat/lon.\nCopy them into the input boxes manually.")
+        try:
+            bounds = (lat_top_var.get(), lat_bottom_var.get(), lon_left_var.get(), lon_right_var.get())
+        except tk.TclError:
+            bounds = None
+        open_map(bounds)
+        messagebox.showinfo("Instructions", "Click the map to see lat/lon.\nCopy them into the input boxes manually.", parent=root)
 
     tk.Button(root, text="Open Map", command=launch_map).grid(row=8, column=0, columnspan=2, pady=6)
-    tk.Button(root, text="OK", command=root.quit).grid(row=9, column=0, columnspan=2, pady=6)
+    tk.Button(root, text="OK", command=lambda: submit_dialog(root)).grid(row=9, column=0, columnspan=2, pady=6)
 
-    root.mainloop()
+    wait_dialog(root)
 
     result = (
         place_var.get().strip() or "Unknown",
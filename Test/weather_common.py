@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import ee
+    import numpy as np
+
+VIS_PALETTE = [
+    '#FFCCFF', '#F5496E', '#CC0000', '#FF0000', '#FF6600', '#FF9933',
+    '#FFCC00', '#FFFF00', '#66FF33', '#93FFFF', '#66FFFF', '#69E1FD',
+    '#5BADFF', '#0E6DC4', '#0000FF', '#9900FF', '#6600FF', '#2200B4',
+    '#000099', '#000066'
+]
+TEMP_MIN = 223
+TEMP_MAX = 318
+WEATHER_COLLECTION = 'NOAA/CFSV2/FOR6H'
+WEATHER_BAND = 'Temperature_height_above_ground'
+# Earth Engine refuses direct downloads above this size, so long months are fetched in band batches.
+EE_MAX_DOWNLOAD_BYTES = 32 * 2**20
+AGGREGATES = ("median", "mean", "max")
+
+# (name, asset id, adm0 filter, max features, color, thickness)
+BORDER_LAYERS = [
+    ("states", 'projects/ee-robertmaurer28/assets/states2', None, 100, (80, 80, 80), 2),
+    ("Mexico", 'USDOS/LSIB_SIMPLE/2017', 'Mexico', 10, (0, 0, 0), 3),
+    ("coast", 'projects/ee-robertmaurer28/assets/coaster', None, 50, (0, 0, 0), 3),
+]
+
+# CFSv2 cells are ~22 km, so a few pixels per cell is all a request needs; the rest is local resampling.
+REQUEST_OVERSAMPLE = 2
+
+LEGEND_W = 400
+LEGEND_H = 30
+LEGEND_X = 50
+
+
+def hex_to_rgb(hex_color):
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (4, 2, 0))
+
+
+def weather_request_size(bounds: tuple[float, float, float, float], output_size: tuple[int, int]) -> tuple[int, int]:
+    from transfer import CFSV2_SCALE_M, request_size
+
+    return request_size(bounds, CFSV2_SCALE_M, output_size, REQUEST_OVERSAMPLE)
+
+
+def month_dates(year: int, month: int) -> tuple[str, str, int]:
+    from datetime import datetime
+
+    days_in_month = 31 if month == 12 else (datetime(year, month + 1, 1) - datetime(year, month, 1)).days
+    return f"{year}-{month:02d}-01", f"{year}-{month:02d}-{days_in_month:02d}", days_in_month
+
+
+def weather_stack_path(
+    output_dir: str,
+    start_date: str,
+    end_date: str,
+    bounds: tuple[float, float, float, float],
+    size: tuple[int, int]
+) -> str:
+    from manifest import input_hash
+
+    key = input_hash(WEATHER_COLLECTION, WEATHER_BAND, start_date, end_date, bounds, size)
+    return os.path.join(output_dir, f".weather_{key}.npy")
+
+
+def fetch_weather_stack(
+    polygon: ee.Geometry,
+    start_date: str,
+    end_date: str,
+    bounds: tuple[float, float, float, float],
+    size: tuple[int, int],
+    output_dir: str
+) -> np.ndarray | None:
+    from io import BytesIO
+
+    import numpy as np
+
+    from ee_limiter import ee_call, http_get
+    from jobs import check_cancelled, report_progress
+    from tracing import span
+    from utils import get_ee
+
+    cache_path = weather_stack_path(output_dir, start_date, end_date, bounds, size)
+    if os.path.exists(cache_path):
+        print(f"Using cached weather stack: {cache_path}")
+        return np.load(cache_path, mmap_mode="r")
+
+    ee = get_ee()
+    collection = ee.ImageCollection(WEATHER_COLLECTION).select(WEATHER_BAND).filter(ee.Filter.date(start_date, end_date))
+    with span("server_compute", call="size"):
+        count = ee_call(collection.size().getInfo)
+    print(f"Found {count} images")
+    if count == 0:
+        return None
+
+    w, h = size
+    per_request = max(1, EE_MAX_DOWNLOAD_BYTES // (w * h * 4))
+    images = collection.toList(count)
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    stack = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(count, h, w))
+    transferred = 0
+    try:
+        for start in range(0, count, per_request):
+            check_cancelled()
+            report_progress(start, count, "fetching weather stack")
+            n = min(per_request, count - start)
+            # Every timestep becomes one band, so a whole batch is a single raw download.
+            batch = ee.ImageCollection(images.slice(start, start + n)).toBands()
+            with span("server_compute", call="download_url", frames=n):
+                url = ee_call(batch.getDownloadURL, {'region': polygon, 'dimensions': f"{w}x{h}", 'format': 'NPY'})
+            with span("http_download", frames=n) as attrs:
+                response = http_get(url)
+                attrs["bytes"] = len(response.content)
+                attrs["format"] = "npy"
+            transferred += len(response.content)
+            with span("decode", frames=n) as attrs:
+                raw = np.load(BytesIO(response.content))
+                stack[start:start + n] = np.stack([raw[name] for name in raw.dtype.names])
+                attrs["pixels"] = n * w * h
+        stack.flush()
+    except BaseException:
+        del stack
+        os.remove(tmp_path)
+        raise
+    del stack
+    os.replace(tmp_path, cache_path)
+    print(f"Fetched {count} timesteps at {w}x{h}, {transferred / 1e6:.1f} MB")
+    return np.load(cache_path, mmap_mode="r")
+
+
+def aggregate_stack(stack: np.ndarray, how: str = "median") -> np.ndarray:
+    import numpy as np
+
+    if how not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate: {how}")
+    return getattr(np, how)(stack, axis=0)
+
+
+def palette_lut() -> np.ndarray:
+    import numpy as np
+
+    colors = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in VIS_PALETTE], np.float64)
+    stops = np.linspace(0, 1, len(VIS_PALETTE))
+    levels = np.arange(256) / 255
+    return np.stack([np.interp(levels, stops, colors[:, ch]) for ch in range(3)], axis=1).round().astype(np.uint8)
+
+
+def colorize(values: np.ndarray) -> np.ndarray:
+    import numpy as np
+
+    # Same linear palette stretch as Earth Engine's visualize(), returned as RGB.
+    scaled = (np.asarray(values, np.float32) - TEMP_MIN) * (255 / (TEMP_MAX - TEMP_MIN)) + 0.5
+    return palette_lut()[np.clip(scaled, 0, 255).astype(np.uint8)]
+
+
+def border_cache_path(output_dir: str, bounds: tuple[float, float, float, float]) -> str:
+    from manifest import input_hash
+
+    return os.path.join(output_dir, f".borders_{input_hash(BORDER_LAYERS, bounds)}.json")
+
+
+def fetch_border_layers(
+    polygon: ee.Geometry,
+    cache_path: str | None = None
+) -> list[tuple[list[dict], tuple[int, int, int], int]]:
+    from ee_limiter import ee_call
+    from tracing import span
+    from utils import get_ee
+
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return [(features, tuple(color), thickness) for features, color, thickness in json.load(f)]
+
+    ee = get_ee()
+    layers = []
+    for name, asset_id, adm0_name, limit, color, thickness in BORDER_LAYERS:
+        try:
+            fc = ee.FeatureCollection(asset_id)
+            if adm0_name:
+                fc = fc.filter(ee.Filter.eq('adm0_name', adm0_name))
+            with span("server_compute", call=f"borders:{name}"):
+                features = ee_call(fc.filterBounds(polygon).toList(limit).getInfo)
+            print(f"Found {len(features)} {name} features")
+            layers.append((features, color, thickness))
+        except Exception as e:
+            print(f"Error fetching {name}: {e}")
+    if cache_path and len(layers) == len(BORDER_LAYERS):
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(layers, f)
+    return layers
+
+
+def feature_polylines(
+    features: list[dict],
+    bounds: tuple[float, float, float, float],
+    size: tuple[int, int]
+) -> list[np.ndarray]:
+    import numpy as np
+
+    lat_top, lat_bottom, lon_left, lon_right = bounds
+    w, h = size
+    span = np.array([lon_right - lon_left, lat_top - lat_bottom])
+    origin = np.array([lon_left, lat_top])
+    sign = np.array([1.0, -1.0])
+    scale = np.array([w, h], np.float64)
+
+    rings = []
+    for feat in features:
+        geom = feat['geometry']
+        if geom['type'] == 'Polygon':
+            rings.append(geom['coordinates'][0])
+        elif geom['type'] == 'MultiPolygon':
+            rings.extend(poly[0] for poly in geom['coordinates'])
+
+    return [
+        ((np.asarray(ring, np.float64)[:, :2] - origin) * sign / span * scale).astype(np.int32)
+        for ring in rings if len(ring)
+    ]
+
+
+def draw_borders(
+    img_np: np.ndarray,
+    layers: list[tuple[list[dict], tuple[int, int, int], int]],
+    bounds: tuple[float, float, float, float]
+) -> None:
+    import cv2
+
+    h, w = img_np.shape[:2]
+    for features, color, thickness in layers:
+        polylines = feature_polylines(features, bounds, (w, h))
+        if polylines:
+            cv2.polylines(img_np, polylines, True, color, thickness)
+
+
+def draw_date(img_np: np.ndarray, date_str: str) -> None:
+    import cv2
+
+    h, w = img_np.shape[:2]
+    cv2.putText(img_np, date_str, (w - 200, h - 50), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3, cv2.LINE_AA)
+
+
+def legend_strip() -> np.ndarray:
+    import numpy as np
+
+    palette = np.array([hex_to_rgb(c) for c in VIS_PALETTE], np.uint8)
+    idx = (np.arange(LEGEND_W) / LEGEND_W * (len(VIS_PALETTE) - 1)).astype(int)
+    return np.broadcast_to(palette[idx], (LEGEND_H + 1, LEGEND_W, 3))
+
+
+def draw_legend(img_np: np.ndarray) -> None:
+    import cv2
+
+    h = img_np.shape[0]
+    legend_y = h - 100
+    img_np[legend_y:legend_y + LEGEND_H + 1, LEGEND_X:LEGEND_X + LEGEND_W] = legend_strip()
+
+    temps_c = [int(TEMP_MIN - 273.15), int(TEMP_MAX - 273.15)]
+    cv2.putText(img_np, f"{temps_c[0]}C", (LEGEND_X, legend_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2, cv2.LINE_AA)
+    cv2.putText(img_np, f"{temps_c[1]}C", (LEGEND_X + LEGEND_W - 50, legend_y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 0), 2, cv2.LINE_AA)
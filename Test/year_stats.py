@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import csv
+import importlib.util
+import os
+import sys
+from typing import TYPE_CHECKING, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from utils import get_ee
+from ee_limiter import ee_call
+from tracing import span
+from Satellite_image import get_landsat_config, year_collection
+
+if TYPE_CHECKING:
+    import ee
+
+STATS_SCALE = 30
+STATS_MAX_PIXELS = 1e9
+NDVI_BUILTUP_MAX = 0.2
+
+# Band names and the linear scale to reflectance for each collection in get_landsat_config.
+# The Landsat 8 T1 DNs use the nominal TOA rescaling without the sun-angle correction.
+REFLECTANCE_BANDS = {
+    "LANDSAT/LC08/C02/T1": {"green": "B3", "red": "B4", "nir": "B5", "swir1": "B6", "scale": 2e-5, "offset": -0.1},
+    "LANDSAT/LT05/C02/T1_L2": {"green": "SR_B2", "red": "SR_B3", "nir": "SR_B4", "swir1": "SR_B5", "scale": 2.75e-5, "offset": -0.2},
+    "LANDSAT/LE07/C02/T1_TOA": {"green": "B2", "red": "B3", "nir": "B4", "swir1": "B5", "scale": 1.0, "offset": 0.0},
+}
+
+
+def ndvi(bands: ee.Image) -> ee.Image:
+    return bands.normalizedDifference(["nir", "red"])
+
+
+def water(bands: ee.Image) -> ee.Image:
+    return bands.normalizedDifference(["green", "swir1"]).gt(0)
+
+
+def builtup(bands: ee.Image) -> ee.Image:
+    return bands.normalizedDifference(["swir1", "nir"]).gt(0).And(ndvi(bands).lt(NDVI_BUILTUP_MAX))
+
+
+# name -> (per-pixel band, "mean" for an area-weighted mean or "km2" for the area where it is set)
+STATISTICS: dict[str, tuple[Callable[[ee.Image], ee.Image], str]] = {
+    "mean_ndvi": (ndvi, "mean"),
+    "builtup_fraction": (builtup, "mean"),
+    "water_fraction": (water, "mean"),
+    "water_km2": (water, "km2"),
+}
+DEFAULT_STATISTICS = list(STATISTICS)
+
+
+def reflectance(image: ee.Image, collection_id: str) -> ee.Image:
+    spec = REFLECTANCE_BANDS[collection_id]
+    names = ["green", "red", "nir", "swir1"]
+    return image.select([spec[n] for n in names], names).multiply(spec["scale"]).add(spec["offset"])
+
+
+def year_statistics(
+    years: list[int],
+    polygon: ee.Geometry,
+    names: list[str] | None = None,
+    scale: float = STATS_SCALE
+) -> list[dict]:
+    ee = get_ee()
+    names = names or DEFAULT_STATISTICS
+    unknown = set(names) - set(STATISTICS)
+    if unknown:
+        raise ValueError(f"Unknown statistics: {', '.join(sorted(unknown))}")
+
+    per_year = []
+    for year in years:
+        collection = year_collection(year, polygon)
+        bands = reflectance(collection.median(), get_landsat_config(year)["collection_id"])
+        # Everything is summed once against pixel area, so one reducer covers means and areas.
+        area = ee.Image.pixelArea().divide(1e6).updateMask(bands.select("nir").mask())
+        stacked = ee.Image.cat(
+            [STATISTICS[name][0](bands).multiply(area).rename(name) for name in names] + [area.rename("area_km2")]
+        )
+        sums = stacked.reduceRegion(
+            reducer=ee.Reducer.sum(),
+            geometry=polygon,
+            scale=scale,
+            maxPixels=STATS_MAX_PIXELS,
+            bestEffort=True,
+        )
+        size = collection.size()
+        per_year.append(ee.Algorithms.If(
+            size.gt(0),
+            ee.Dictionary(sums).set("year", year).set("scenes", size),
+            ee.Dictionary({"year": year, "scenes": 0}),
+        ))
+
+    with span("server_compute", call="statistics", years=len(years)):
+        info = ee_call(ee.List(per_year).getInfo)
+
+    rows = []
+    for sums in info:
+        row = {"year": sums["year"], "scenes": sums["scenes"], "area_km2": sums.get("area_km2")}
+        area_km2 = row["area_km2"]
+        for name in names:
+            value = sums.get(name)
+            if value is not None and STATISTICS[name][1] == "mean":
+                value = value / area_km2 if area_km2 else None
+            row[name] = value
+        rows.append(row)
+    return rows
+
+
+def statistics_format(fmt: str) -> str:
+    # Checked before the server-side reduction runs, so a missing writer never costs a request.
+    find = importlib.util.find_spec
+    if fmt == "parquet" and not (find("pandas") and (find("pyarrow") or find("fastparquet"))):
+        print("Parquet needs pandas with pyarrow or fastparquet; writing CSV instead.")
+        return "csv"
+    return fmt
+
+
+def write_statistics(rows: list[dict], path: str) -> str:
+    if path.endswith(".parquet"):
+        import pandas as pd
+        pd.DataFrame(rows).to_parquet(path, index=False)
+        return path
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def statistics_path(output_dir: str, place_name: str, fmt: str = "csv") -> str:
+    return os.path.join(output_dir, f"{place_name}_statistics.{fmt}")